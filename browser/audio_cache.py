@@ -0,0 +1,105 @@
+# Decoded audio kept in memory for quick re-triggering.
+# Entries are keyed by path and modification time, so a file that changes on
+# disk is decoded again. The cache is bounded by the bytes of the decoded
+# buffers and drops the least recently used entries first.
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# default memory budget for decoded buffers
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def join_blocks(blocks, channels):
+    """
+    Decoded data of a file read in (frames, channels) blocks, shaped
+    like the result of sf.read (1d for mono).
+    """
+    data = np.concatenate(blocks) if blocks else \
+        np.zeros((0, channels), dtype=np.float32)
+    if channels == 1:
+        data = data[:, 0]
+    return data
+
+
+class AudioCache:
+    """
+    LRU cache of decoded float32 audio, (data, samplerate) per file.
+
+    All methods may be called from several threads. Files are decoded
+    by the callers (the player while streaming, the Prefetcher) and
+    stored with put(), buffers larger than the whole budget are not
+    kept. lookup() counts hits and misses, they and nbytes can be read
+    at any time (see stats()).
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(file_path):
+        return (os.path.abspath(file_path), os.stat(file_path).st_mtime_ns)
+
+    def lookup(self, file_path):
+        """
+        Cached (data, samplerate) of a file or None, counted as a hit or
+        a miss.
+        """
+        key = self.key(file_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def __contains__(self, file_path):
+        """
+        True if the current version of the file is cached, not counted
+        and without touching the LRU order.
+        """
+        key = self.key(file_path)
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, entry):
+        """
+        Store a decoded entry and evict old ones over the budget.
+        """
+        size = entry[0].nbytes
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[0].nbytes
+            self._entries[key] = entry
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (data, _) = self._entries.popitem(last=False)
+                self.nbytes -= data.nbytes
+
+    def stats(self):
+        """
+        Hit/miss counters and memory use as a dict.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
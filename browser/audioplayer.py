@@ -1,69 +1,288 @@
-import soundfile as sf
 import soundcard as sc
+import soundfile as sf
 import threading
+from collections import namedtuple
+from contextlib import ExitStack
+
 import numpy as np
 
+from browser.audio_cache import AudioCache, DEFAULT_MAX_BYTES, join_blocks
+from browser.prefetch import Prefetcher
+from browser.ring_buffer import RingBuffer
+
+# frames per block handed to the speaker
+BLOCK_SIZE = 512
+# seconds of audio queued in the output device
+LATENCY = 0.05
+# blocks decoded ahead of the speaker
+RING_BLOCKS = 16
+
+# a play() call, superseded by the next play() or stop()
+_Request = namedtuple('_Request', ['generation', 'file_path', 'start', 'end'])
+# the ring buffer the feeder fills for a request
+_Source = namedtuple(
+    '_Source', ['generation', 'ring', 'samplerate', 'channels']
+)
+
 
 class AudioPlayer:
-    def __init__(self):
+    """
+    Plays samples on the default speaker. Decoded files are kept in an
+    LRU AudioCache of cache_bytes, so replaying recently heard samples
+    does not decode them again.
+
+    Two long-lived threads do the work. The feeder reads the region of
+    the current file (from the cache or streamed from disk, starting
+    with a seek to the start frame) into a RingBuffer. When looping it
+    continues with the start frame right after the end frame, so loops
+    have no gap. The audio thread owns the output stream, which stays
+    open as long as the sample format does not change, and hands it the
+    ring in blocks of blocksize frames. latency is the length of the
+    device buffer in seconds.
+
+    play() and stop() only publish a new generation, both threads check
+    it once per block, so neither has to wait for the other.
+
+    prefetch() decodes the samples likely played next into the cache on
+    a background queue (see Prefetcher).
+    """
+
+    def __init__(self, cache_bytes=DEFAULT_MAX_BYTES, blocksize=BLOCK_SIZE,
+                 latency=LATENCY):
         self.default_speaker = sc.default_speaker()
-        self.play_thread = None
-        self.playing = False
+        self.cache = AudioCache(cache_bytes)
+        self.prefetcher = Prefetcher(self.cache)
+        self.blocksize = blocksize
+        self.latency = latency
         self.loop = False
-        self.audio_data = None
+        self.file_path = None
+        self.start = 0.0
+        self.end = None
         self.samplerate = None
 
+        self.generation = 0
+        self._request = None
+        self._source = None
+        # generation that was played to its end
+        self._finished = 0
+        self._wake_feeder = threading.Event()
+        self._wake_audio = threading.Event()
+        self._threads = None
+
+    @property
+    def playing(self):
+        request = self._request
+        return request is not None and self._finished != request.generation
+
     def load_audio(self, file_path, start=0.0, end=None):
-        data, samplerate = sf.read(file_path, dtype='float32')
-        if end:
-            end_idx = int(end * samplerate)
+        """
+        Select the file and the region (in seconds, end None = end of
+        file) to play. Only the header is read here.
+        """
+        self.file_path = file_path
+        self.start = start
+        self.end = end
+        self.samplerate = sf.info(file_path).samplerate
+
+    def _region(self, samplerate, frames, request):
+        start_idx = min(int(request.start * samplerate), frames)
+        if request.end:
+            end_idx = min(int(request.end * samplerate), frames)
         else:
-            end_idx = len(data)
-        start_idx = int(start * samplerate)
-        self.audio_data = data[start_idx:end_idx]
-        self.samplerate = samplerate
+            end_idx = frames
+        return start_idx, max(end_idx, start_idx)
 
-    def _play_audio(self):
-        chunk_size = 1024  # frames per chunk
+    def _blocks(self, request):
+        """
+        Blocks (frames, channels) of one pass over the region, from the
+        cache or streamed from the file.
+        """
+        entry = self.cache.lookup(request.file_path)
+        if entry is not None:
+            data, samplerate = entry
+            if data.ndim == 1:
+                data = np.expand_dims(data, axis=-1)
+            start_idx, end_idx = self._region(samplerate, len(data), request)
+            for idx in range(start_idx, end_idx, self.blocksize):
+                yield data[idx:min(idx + self.blocksize, end_idx)]
+            return
 
-        while self.playing:
-            with self.default_speaker.player(
-                    samplerate=self.samplerate) as player:
+        with sf.SoundFile(request.file_path) as f:
+            key = self.cache.key(request.file_path)
+            start_idx, end_idx = self._region(f.samplerate, f.frames, request)
+            # keep the decoded file if it is played completely and fits
+            whole_file = (
+                start_idx == 0 and end_idx == f.frames and
+                f.frames * f.channels * 4 <= self.cache.max_bytes
+            )
+            blocks = []
 
-                frames = self.audio_data
-                idx = 0
-                while idx < len(frames) and self.playing:
-                    end_idx = min(idx + chunk_size, len(frames))
-                    chunk = frames[idx:end_idx]
+            f.seek(start_idx)
+            remaining = end_idx - start_idx
+            while remaining > 0:
+                block = f.read(
+                    min(self.blocksize, remaining), dtype='float32',
+                    always_2d=True
+                )
+                if len(block) == 0:
+                    break
+                remaining -= len(block)
+                if whole_file:
+                    blocks.append(block)
+                yield block
 
-                    # Ensure chunk shape: (frames, channels)
-                    if chunk.ndim == 1:
-                        chunk = np.expand_dims(chunk, axis=-1)
+            if whole_file and remaining == 0:
+                self.cache.put(
+                    key, (join_blocks(blocks, f.channels), f.samplerate)
+                )
 
-                    player.play(chunk)
-                    idx += chunk_size
+    def _feed_loop(self):
+        handled = None
+        while True:
+            request = self._request
+            if request is None or request is handled:
+                self._wake_feeder.wait()
+                self._wake_feeder.clear()
+                continue
+            handled = request
+            try:
+                self._feed(request)
+            except Exception as e:
+                print(f"Error playing {request.file_path}: {e}")
+                self._finished = request.generation
 
-                if not self.loop:
-                    break
+    def _feed(self, request):
+        info = sf.info(request.file_path)
+        ring = RingBuffer(RING_BLOCKS * self.blocksize, info.channels)
+        self._source = _Source(
+            request.generation, ring, info.samplerate, info.channels
+        )
+        self._wake_audio.set()
+        wait = self.blocksize / info.samplerate
 
-        self.playing = False  # Playback done
+        blocks = self._blocks(request)
+        while True:
+            written = 0
+            # blocks of this pass, later passes replay them from memory
+            kept, kept_bytes = [], 0
+            for block in blocks:
+                if kept is not None:
+                    kept.append(block)
+                    kept_bytes += block.nbytes
+                    if kept_bytes > self.cache.max_bytes:
+                        kept = None
+                while len(block):
+                    if request.generation != self.generation or \
+                            self._finished == request.generation:
+                        return
+                    n = ring.write(block)
+                    if n == 0:
+                        # ring is full, the audio thread wakes us
+                        self._wake_feeder.wait(wait)
+                        self._wake_feeder.clear()
+                        continue
+                    written += n
+                    block = block[n:]
+                    self._wake_audio.set()
+            if not written or not self.loop:
+                break
+            blocks = kept if kept is not None else self._blocks(request)
 
-    def play(self):
-        if self.audio_data is None:
-            return
+        ring.eof = True
+        self._wake_audio.set()
+
+    def _audio_loop(self):
+        stream_format = None
+        with ExitStack() as stream_context:
+            while True:
+                request = self._request
+                source = self._source
+                if request is None or source is None or \
+                        source.generation != request.generation or \
+                        self._finished == request.generation:
+                    self._wake_audio.wait()
+                    self._wake_audio.clear()
+                    continue
+
+                ring = source.ring
+                if ring.available() < self.blocksize and not ring.eof:
+                    # wait for the feeder
+                    self._wake_audio.wait(self.blocksize / source.samplerate)
+                    self._wake_audio.clear()
+                    continue
+
+                try:
+                    if (source.samplerate, source.channels) != stream_format:
+                        stream_format = None
+                        stream_context.close()
+                        stream = stream_context.enter_context(
+                            self.default_speaker.player(
+                                samplerate=source.samplerate,
+                                channels=source.channels,
+                                blocksize=int(
+                                    self.latency * source.samplerate
+                                )
+                            )
+                        )
+                        stream_format = (source.samplerate, source.channels)
+                        block = np.zeros(
+                            (self.blocksize, source.channels),
+                            dtype=np.float32
+                        )
 
-        self.stop()  # Stop previous playback
+                    n = ring.read(block)
+                    self._wake_feeder.set()
+                    if n:
+                        stream.play(block[:n])
+                except Exception as e:
+                    # e.g. device busy or channel count not supported,
+                    # the next request opens the device again
+                    print(f"Error playing {request.file_path}: {e}")
+                    self._finished = source.generation
+                    self._wake_feeder.set()
+                    stream_format = None
+                    try:
+                        stream_context.close()
+                    except Exception as e:
+                        print(f"Error closing the audio device: {e}")
+                    continue
 
-        self.playing = True
-        self.play_thread = threading.Thread(
-            target=self._play_audio, daemon=True)
-        self.play_thread.start()
+                if ring.eof and ring.available() == 0:
+                    self._finished = source.generation
+
+    def _start_threads(self):
+        if self._threads is not None:
+            return
+        self._threads = [
+            threading.Thread(target=self._feed_loop, daemon=True),
+            threading.Thread(target=self._audio_loop, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def play(self):
+        if self.file_path is None:
+            return
+        self._start_threads()
+        self.generation += 1
+        self._request = _Request(
+            self.generation, self.file_path, self.start, self.end
+        )
+        self._wake_feeder.set()
+        self._wake_audio.set()
 
     def stop(self):
-        self.playing = False
-        if self.play_thread and self.play_thread.is_alive():
-            self.play_thread.join()
-        self.play_thread = None
+        self.generation += 1
+        self._request = None
+        self._wake_feeder.set()
+        self._wake_audio.set()
+
+    def prefetch(self, paths):
+        """
+        Decode paths into the cache in the background, cancelling the
+        previous prefetch.
+        """
+        self.prefetcher.prefetch(paths)
 
     def set_loop(self, loop):
         self.loop = loop
@@ -0,0 +1,169 @@
+# Binary column cache for samples_data.csv.
+# Every column of the parsed DataFrame is stored as its own .npy file, so
+# later launches can memory-map the arrays instead of parsing the CSV again.
+# The cache is invalidated automatically when the size or modification time
+# of the CSV changes.
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 3
+MANIFEST_NAME = 'manifest.json'
+
+
+def cache_dir_for(csv_path):
+    """
+    Return the default cache directory next to the CSV file.
+    """
+    base, _ = os.path.splitext(os.path.abspath(csv_path))
+    return base + '_cache'
+
+
+def source_signature(csv_path):
+    """
+    Size and mtime of the CSV, used to detect a stale cache.
+    """
+    st = os.stat(csv_path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+class ColumnCache:
+    """
+    Per-column .npy store for a single CSV file.
+
+    Numeric columns are saved as plain arrays. String and categorical
+    columns are saved as integer codes plus a fixed-width unicode array of
+    categories, so both parts can be memory-mapped. Categoricals are
+    restored as categoricals, other strings as object columns.
+    """
+
+    def __init__(self, csv_path, cache_dir=None):
+        self.csv_path = csv_path
+        self.cache_dir = cache_dir or cache_dir_for(csv_path)
+        self.manifest = None
+
+    def _path(self, filename):
+        return os.path.join(self.cache_dir, filename)
+
+    def is_valid(self):
+        """
+        Check whether the cache exists and matches the current CSV.
+        """
+        try:
+            with open(self._path(MANIFEST_NAME), 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if manifest.get('version') != CACHE_VERSION:
+            return False
+        if manifest.get('source') != source_signature(self.csv_path):
+            return False
+
+        self.manifest = manifest
+        return True
+
+    @property
+    def column_names(self):
+        """
+        All cached column names in their original order.
+        """
+        return [entry['name'] for entry in self.manifest['columns']]
+
+    def numeric_columns(self):
+        """
+        Names of the int and float columns, known without loading them.
+        """
+        return [
+            entry['name'] for entry in self.manifest['columns']
+            if entry['kind'] == 'numeric'
+            and np.dtype(entry['dtype']).kind in 'iuf'
+        ]
+
+    def load_column(self, name):
+        """
+        Load a single column (memory-mapped if numeric).
+        """
+        for entry in self.manifest['columns']:
+            if entry['name'] == name:
+                return self._load_column(entry)
+        raise KeyError(name)
+
+    def _load_column(self, entry):
+        if entry['kind'] == 'numeric':
+            return np.load(self._path(entry['file']), mmap_mode='r')
+
+        codes = np.load(self._path(entry['file']), mmap_mode='r')
+        categories = np.load(self._path(entry['categories']), mmap_mode='r')
+        # -1 codes become NaN, like missing strings in read_csv
+        cat = pd.Categorical.from_codes(codes, categories)
+        if entry['kind'] == 'category':
+            return cat
+        return cat.astype(object)
+
+    def load(self, columns=None):
+        """
+        Load the cached columns (default: all) into a DataFrame, numeric
+        columns are memory-mapped.
+        """
+        if self.manifest is None and not self.is_valid():
+            raise FileNotFoundError(f"No valid cache in {self.cache_dir}")
+
+        data = {
+            entry['name']: self._load_column(entry)
+            for entry in self.manifest['columns']
+            if columns is None or entry['name'] in columns
+        }
+        return pd.DataFrame(data, copy=False)
+
+    def save(self, df):
+        """
+        Write all columns of df to the cache directory.
+        The manifest is written last, so an interrupted write never
+        produces a cache that looks valid.
+        """
+        if os.path.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+        os.makedirs(self.cache_dir)
+
+        columns = []
+        for i, name in enumerate(df.columns):
+            series = df[name]
+            filename = f"col_{i:04d}.npy"
+            if series.dtype.kind in 'biuf':
+                np.save(self._path(filename), series.to_numpy())
+                columns.append({
+                    'name': name, 'kind': 'numeric', 'file': filename,
+                    'dtype': series.dtype.str
+                })
+            else:
+                if isinstance(series.dtype, pd.CategoricalDtype):
+                    kind = 'category'
+                    cat = series.array
+                else:
+                    kind = 'string'
+                    values = series.where(series.isna(), series.astype(str))
+                    cat = pd.Categorical(values)
+                cat_file = f"col_{i:04d}_categories.npy"
+                np.save(self._path(filename), cat.codes.astype(np.int32))
+                np.save(
+                    self._path(cat_file),
+                    np.asarray(cat.categories, dtype=str)
+                )
+                columns.append({
+                    'name': name, 'kind': kind,
+                    'file': filename, 'categories': cat_file
+                })
+
+        manifest = {
+            'version': CACHE_VERSION,
+            'source': source_signature(self.csv_path),
+            'columns': columns,
+        }
+        with open(self._path(MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f)
+        self.manifest = manifest
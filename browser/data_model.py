@@ -1,73 +1,545 @@
+import os
 import pandas as pd
 import re
+import threading
+from collections import OrderedDict
 import numpy as np
-from sklearn.metrics.pairwise import cosine_distances
+
+from browser.column_cache import ColumnCache, source_signature
+from browser.features import FeatureMatrix
+from browser.knn_index import KnnIndex, top_k
+from browser.path_index import PathIndex, sample_path
+from browser.schema import compact_dtypes, memory_report
+from browser.stem_index import StemIndex
+
+# below this many filtered rows a brute force scan beats the index
+BRUTE_FORCE_ROWS = 20000
+
+# k-NN indexes kept in memory (least recently used ones are dropped, they
+# can be loaded from the cache directory again)
+KNN_CACHE_SIZE = 4
+
+# columns needed for the first paint of the main window, all other
+# columns are loaded in the background or on first use
+STARTUP_COLUMNS = ['idx', 'stem', 'dir_path', 'duration', 'channels',
+                   'tonality', 'tempo', 'bit_depth']
+
+# rows per chunk when parsing the CSV (one progress report per chunk)
+PARSE_CHUNK_ROWS = 50000
+
+# rows per step of a similarity search, between progress reports
+DISTANCE_CHUNK_ROWS = 50000
+
+
+class _CountingReader:
+    """
+    File wrapper counting the bytes read, for parse progress.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def __iter__(self):
+        return iter(self.f)
 
 
 class SampleDataModel:
-    def __init__(self, csv_path):
-        self.df_all = pd.read_csv(
-            csv_path,
-            low_memory=False
+    """
+    All sample metadata plus the current filter view.
+
+    progress is an optional callback progress(stage, done, total) with
+    stage one of 'parse' (rows parsed, total estimated from the bytes
+    read so far), 'types' (columns converted),
+    'paths' (0/1, sample paths resolved and checked),
+    'columns' (columns loaded in the background) and 'features' (0/1,
+    feature matrix built). It is also called from the background loader
+    thread. features_ready is set once the feature matrix exists.
+
+    samples_root is the Samples folder the 'dir_path' column is relative
+    to. The PathIndex of all sample files is built in the background
+    as well, path_index is None until it exists.
+    """
+
+    def __init__(self, csv_path, use_cache=True, progress=None,
+                 samples_root=None):
+        self.csv_path = csv_path
+        self.samples_root = samples_root
+        self.cache = ColumnCache(csv_path) if use_cache else None
+        self.progress = progress or (lambda stage, done, total: None)
+        self.features_ready = threading.Event()
+        self.path_index = None
+        self._column_lock = threading.Lock()
+        self._features_lock = threading.Lock()
+        self._stem_lock = threading.Lock()
+        # lazily loaded columns, guarded by _column_lock
+        self._columns = {}
+
+        # df_all is never changed after loading, so worker threads can
+        # read it without a lock. Columns loaded later live in _columns
+        # (see column()). The current filter is an array of row positions
+        # into df_all (in view order), derived columns live in separate
+        # full-length arrays.
+        self.df_all = self.load_csv()
+        self.rows = np.arange(len(self.df_all))
+        self._no_distance = np.full(len(self.df_all), np.nan, np.float32)
+        self.distance = self._no_distance
+        # incremented whenever rows or distance change
+        self.version = 0
+
+        # stem -> first row position in df_all
+        stems = self.df_all['stem'].to_numpy()
+        self.stem_rows = dict(zip(stems[::-1], range(len(stems) - 1, -1, -1)))
+
+        self.feature_columns = [
+            col for col in self._numeric_columns
+            if col not in ['idx', 'distance']
+        ]
+        self._features = None
+        self._knn = OrderedDict()
+        self._stem_index = None
+
+        # read the remaining columns and build the feature matrix
+        # without blocking the first paint
+        self._loader = threading.Thread(
+            target=self._load_in_background, daemon=True
+        )
+        self._loader.start()
+
+    def load_csv(self):
+        """
+        Load the samples CSV, using the binary column cache if it is
+        still valid. On a cache miss the CSV is parsed, converted to
+        compact dtypes and the cache is (re)written for the next launch.
+        """
+        if not os.path.exists(self.csv_path):
+            raise FileNotFoundError(self.csv_path)
+
+        cache = self.cache
+        if cache is not None and cache.is_valid():
+            # only the startup columns, the rest is loaded lazily
+            self.all_columns = cache.column_names
+            self._numeric_columns = cache.numeric_columns()
+            return cache.load(columns=STARTUP_COLUMNS)
+
+        size = os.path.getsize(self.csv_path)
+        chunks = []
+        n_rows = 0
+        with open(self.csv_path, 'rb') as f:
+            reader = _CountingReader(f)
+            for chunk in pd.read_csv(
+                reader,
+                low_memory=False,
+                chunksize=PARSE_CHUNK_ROWS
+            ):
+                chunks.append(chunk)
+                n_rows += len(chunk)
+                estimate = n_rows * size // max(reader.bytes_read, 1)
+                self.progress('parse', n_rows, max(estimate, n_rows))
+        df = pd.concat(chunks, ignore_index=True) if chunks else \
+            pd.read_csv(self.csv_path)
+        # types are guessed per chunk: a column with text in some chunks
+        # only would hold numbers and strings mixed, a single read keeps
+        # all of its values as text, so those columns are read again
+        mixed = [
+            col for col in df.columns
+            if len({chunk[col].dtype == object for chunk in chunks}) > 1
+        ]
+        if mixed:
+            df[mixed] = pd.read_csv(
+                self.csv_path, usecols=mixed, dtype=str, low_memory=False
+            )[mixed]
+        self.progress('parse', len(df), len(df))
+
+        df = compact_dtypes(
+            df, progress=lambda done, n: self.progress('types', done, n)
+        )
+        if cache is not None:
+            try:
+                cache.save(df)
+            except OSError as e:
+                print(f"Could not write column cache: {e}")
+        self.all_columns = df.columns.tolist()
+        self._numeric_columns = df.select_dtypes(
+            include=[np.number]).columns.tolist()
+        return df
+
+    def _load_in_background(self):
+        if self.samples_root is not None:
+            self.progress('paths', 0, 1)
+            self.path_index = PathIndex(
+                self.samples_root, self.df_all['stem'],
+                self.df_all['dir_path']
+            )
+            self.progress('paths', 1, 1)
+
+        missing = [c for c in self.all_columns if c not in self.df_all]
+        for i, name in enumerate(missing):
+            values = self.cache.load_column(name)
+            if isinstance(values, np.memmap):
+                # read the pages now instead of on first use
+                values = np.array(values)
+            with self._column_lock:
+                self._columns.setdefault(name, values)
+            self.progress('columns', i + 1, len(missing))
+        self.features
+
+    def _lazy_column(self, name):
+        """
+        Values of a column that is not in df_all, loaded from the cache
+        on first use (safe to call from worker threads).
+        """
+        with self._column_lock:
+            values = self._columns.get(name)
+            if values is None:
+                values = self.cache.load_column(name)
+                self._columns[name] = values
+        return values
+
+    def ensure_columns(self, names):
+        """
+        Make sure the given columns are loaded (e.g. before showing
+        them all in a table).
+        """
+        for name in names:
+            if name not in self.df_all and name in self.all_columns:
+                self._lazy_column(name)
+
+    @property
+    def features(self):
+        """
+        Float32 feature matrix, built once from all feature columns.
+        """
+        with self._features_lock:
+            if self._features is None:
+                self.progress('features', 0, 1)
+                self._features = FeatureMatrix(
+                    {name: self.column(name) for name in self.feature_columns},
+                    self.feature_columns, len(self.df_all)
+                )
+                self.features_ready.set()
+                self.progress('features', 1, 1)
+        return self._features
+
+    def memory_report(self):
+        """
+        Memory usage per column, df_all and the columns loaded later.
+        """
+        with self._column_lock:
+            columns = dict(self._columns)
+        data = {name: self.df_all[name] for name in self.df_all}
+        data.update(columns)
+        return memory_report(pd.DataFrame(data, copy=False))
+
+    @property
+    def stem_index(self):
+        """
+        Trigram index over 'stem', built on the first search.
+        """
+        with self._stem_lock:
+            if self._stem_index is None:
+                self._stem_index = StemIndex(self.df_all['stem'])
+        return self._stem_index
+
+    def column(self, name):
+        """
+        Full-length values of any column of the CSV or a derived column.
+        """
+        if name == 'distance':
+            return self.distance
+        if name == 'file_missing':
+            return self.file_missing
+        if name in self.df_all:
+            return self.df_all[name].to_numpy()
+        return np.asarray(self._lazy_column(name))
+
+    def view_column(self, name):
+        """
+        Values of a column for the rows of the current filter.
+        """
+        return self.column(name)[self.rows]
+
+    def derived_columns(self):
+        """
+        Derived columns for table models, aligned with df_all.
+        """
+        columns = {'distance': self.distance}
+        if self.path_index is not None:
+            columns['file_missing'] = self.path_index.missing
+        return columns
+
+    @property
+    def file_missing(self):
+        """
+        True for rows whose sample file does not exist (all False until
+        the paths are checked).
+        """
+        if self.path_index is None:
+            return np.zeros(len(self.df_all), dtype=bool)
+        return self.path_index.missing
+
+    def sample_path(self, row):
+        """
+        Absolute path of the sample file of a row position in df_all,
+        None if its directory or stem is unknown.
+        """
+        if self.path_index is not None:
+            return self.path_index.paths[row]
+        dir_path = self.df_all['dir_path'].iat[row]
+        stem = self.df_all['stem'].iat[row]
+        if not isinstance(dir_path, str) or not isinstance(stem, str):
+            return None
+        return sample_path(
+            self.samples_root or os.path.join(os.getcwd(), 'Samples'),
+            dir_path, stem
         )
-        if 'distance' not in self.df_all.columns:
-            self.df_all['distance'] = np.nan
-        self.df_filtered = self.df_all.copy()
 
     def filter_by_regex(self, pattern, column='stem'):
+        """
+        Set the current filter to the rows whose column matches pattern
+        and return their row positions. Distances are reset.
+        """
+        rows = self.match_rows(pattern, column)
+        if rows is None:
+            return self.rows
+        return self.set_filter(rows)
+
+    def match_rows(self, pattern, column='stem', hide_missing=False):
+        """
+        Row positions whose column matches pattern, or None for an
+        invalid pattern. With hide_missing, rows whose sample file does
+        not exist are left out. Does not change the current filter, so
+        it can run on a worker thread.
+        """
+        rows = self._match(pattern, column)
+        if rows is not None and hide_missing:
+            rows = rows[~self.file_missing[rows]]
+        return rows
+
+    def _match(self, pattern, column):
         if not pattern:
-            self.df_filtered = self.df_all.copy()
-            return self.df_filtered
+            return np.arange(len(self.df_all))
 
         try:
+            if column == 'stem':
+                # trigram index prunes the candidates before the regex runs
+                return self.stem_index.search(pattern)
             regex = re.compile(pattern, re.IGNORECASE)
             # vectorized with Series.str.contains
-            mask = self.df_all[column].str.contains(regex, na=False)
-            self.df_filtered = self.df_all[mask].copy()
-            return self.df_filtered
+            mask = pd.Series(self.column(column)).str.contains(
+                regex, na=False
+            )
+            return np.flatnonzero(mask.to_numpy())
         except re.error as e:
             print(f"Regex-Fehler: {e}")
-            return self.df_filtered
+            return None
+
+    def set_filter(self, rows):
+        """
+        Make rows (e.g. from match_rows()) the current filter.
+        Distances are reset.
+        """
+        self.rows = rows
+        self.distance = self._no_distance
+        self.version += 1
+        return self.rows
+
+    def similarity(self, reference_file, selected_features,
+                   metric='euclidean', rows=None, progress=None,
+                   cancelled=None):
+        """
+        Distances of rows (default: the current filter) to the
+        reference_file. Returns (rows sorted by distance, full-length
+        distance array), or None if the reference is not in rows or the
+        search was cancelled. Does not change the current filter, so it
+        can run on a worker thread: progress(done, total) is called after
+        every chunk of rows, cancelled() is checked before each.
+        Missing values count as 0.
+        """
+        if rows is None:
+            rows = self.rows
+        ref_row = self.stem_rows.get(reference_file)
+        if ref_row is None or not np.any(rows == ref_row):
+            print("Referenzdatei nicht gefunden!")
+            return None
+
+        features = self.features
+        if metric == 'cosine':
+            distance_fn = features.cosine
+        else:
+            distance_fn = features.euclidean
+
+        distances = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), DISTANCE_CHUNK_ROWS):
+            if cancelled is not None and cancelled():
+                return None
+            chunk = rows[start:start + DISTANCE_CHUNK_ROWS]
+            distances[start:start + len(chunk)] = distance_fn(
+                ref_row, selected_features, chunk
+            )
+            if progress is not None:
+                progress(start + len(chunk), len(rows))
+
+        distance = np.full(len(self.df_all), np.nan, np.float32)
+        distance[rows] = distances
+        return rows[np.argsort(distances, kind='stable')], distance
+
+    def set_distances(self, rows, distance):
+        """
+        Make a result of similarity() the current filter.
+        """
+        self.rows = rows
+        self.distance = distance
+        self.version += 1
+        return self.rows
 
     def compute_distances(self, reference_file, selected_features):
         """
         Compute distances of all filtered files to the reference_file,
-        based on selected numerical features.
+        based on selected numerical features, and sort the filtered rows
+        by distance. Missing values count as 0.
         """
-        df = self.df_filtered
+        result = self.similarity(reference_file, selected_features)
+        if result is None:
+            return self.rows
+        return self.set_distances(*result)
 
-        # Fill NaN values with 0 for distance calculation
-        df[selected_features] = df[selected_features].fillna(0)
+    def compute_cosine_distances(self, reference_file, selected_features):
+        result = self.similarity(
+            reference_file, selected_features, metric='cosine'
+        )
+        if result is None:
+            return self.rows
+        return self.set_distances(*result)
 
-        ref_row = df[df['stem'] == reference_file]
-        if ref_row.empty:
+    def nearest(self, stem, features, k=50, metric='euclidean'):
+        """
+        Return the k samples of the current filter that are closest to
+        stem, as a DataFrame sorted by distance.
+        """
+        ref_row = self.stem_rows.get(stem)
+        if ref_row is None:
             print("Referenzdatei nicht gefunden!")
-            return df
+            return self.df_all.iloc[:0]
 
-        ref_values = ref_row[selected_features].astype(float).values[0]
-        other_values = df[selected_features].astype(float).values
+        rows = self.rows
+        if len(rows) < BRUTE_FORCE_ROWS:
+            candidates = rows
+        else:
+            candidates = self._index_candidates(
+                ref_row, features, k, metric, rows
+            )
 
-        distances = np.linalg.norm(other_values - ref_values, axis=1)
-        df_with_dist = df.copy()
-        df_with_dist['distance'] = distances
+        if metric == 'cosine':
+            distances = self.features.cosine(ref_row, features, candidates)
+        else:
+            distances = self.features.euclidean(ref_row, features, candidates)
 
-        df_sorted = df_with_dist.sort_values('distance')
-        return df_sorted
+        best = top_k(distances, k)
+        result = self.df_all.iloc[candidates[best]].copy()
+        result['distance'] = distances[best]
+        return result
 
-    def compute_cosine_distances(self, reference_file, selected_features):
-        df = self.df_filtered
+    def _index_candidates(self, ref_row, features, k, metric, rows):
+        """
+        Query the k-NN index, widening the query until k hits fall
+        inside the current filter.
+        """
+        index = self.knn_index(features, metric)
+        vector = self.features.vectors(features, [ref_row])[0]
+
+        in_filter = None
+        if len(rows) < len(self.df_all):
+            in_filter = np.zeros(len(self.df_all), dtype=bool)
+            in_filter[rows] = True
 
-        # Fill NaN values with 0 for distance calculation
-        df[selected_features] = df[selected_features].fillna(0)
+        k_query = k
+        while True:
+            found = index.query(vector, k_query)
+            if in_filter is not None:
+                found = found[in_filter[found]]
+            if len(found) >= k or k_query >= len(index):
+                return found
+            k_query *= 4
+
+    def knn_index(self, features, metric='euclidean'):
+        """
+        Return the k-NN index for the features and metric. It is loaded
+        from the cache directory if possible, otherwise built and saved.
+        """
+        key = (tuple(features), metric)
+        if key in self._knn:
+            self._knn.move_to_end(key)
+            return self._knn[key]
 
-        ref_row = df[df['stem'] == reference_file]
-        if ref_row.empty:
-            return df
+        path = None
+        signature = source_signature(self.csv_path)
+        if self.cache is not None and os.path.isdir(self.cache.cache_dir):
+            path = os.path.join(
+                self.cache.cache_dir, KnnIndex.filename(features, metric)
+            )
 
-        ref_values = ref_row[selected_features].astype(float).values
-        other_values = df[selected_features].astype(float).values
+        index = KnnIndex.load(path, signature) if path else None
+        if index is None:
+            index = KnnIndex(self.features, features, metric)
+            if path:
+                try:
+                    index.save(path, signature)
+                except OSError as e:
+                    print(f"Could not write k-NN index: {e}")
 
-        distances = cosine_distances(other_values, ref_values).flatten()
-        df_with_dist = df.copy()
-        df_with_dist['distance'] = distances
-        return df_with_dist.sort_values('distance')
+        self._knn[key] = index
+        while len(self._knn) > KNN_CACHE_SIZE:
+            self._knn.popitem(last=False)
+        return index
+
+    def nearest_batch(self, references, features, k=10, metric='euclidean',
+                      workers=None):
+        """
+        k nearest samples of the current filter for many references.
+
+        references is either a list of stems or an array of feature
+        vectors (one row per reference, columns as in features). A stem
+        reference is left out of its own neighbour list.
+        Returns (neighbours, distances), both (len(references), k), with
+        neighbours as row positions in df_all.
+        """
+        rows = self.rows
+        self_rows = None
+
+        if len(references) and isinstance(references[0], str):
+            missing = [s for s in references if s not in self.stem_rows]
+            if missing:
+                raise KeyError(f"Unknown stems: {missing[:5]}")
+            ref_rows = np.array([self.stem_rows[s] for s in references])
+            vectors = self.features.vectors(features, ref_rows)
+
+            # position of each reference within the filtered rows
+            positions = np.full(len(self.df_all), -1)
+            positions[rows] = np.arange(len(rows))
+            self_rows = positions[ref_rows]
+        else:
+            vectors = np.asarray(references, dtype=np.float32)
+
+        return self.features.batch_top_k(
+            vectors, features, k, metric,
+            rows=rows, self_rows=self_rows, workers=workers
+        )
+
+    def similarity_graph(self, features, k=10, metric='euclidean',
+                         workers=None):
+        """
+        Top-k neighbour lists of every sample in the library (excluding
+        itself), for deduplication and "more like this" playlists.
+        Returns (neighbours, distances), both (len(df_all), k).
+        """
+        n = len(self.df_all)
+        return self.features.batch_top_k(
+            self.features.vectors(features, slice(None)), features, k, metric,
+            self_rows=np.arange(n), workers=workers
+        )
@@ -0,0 +1,254 @@
+# Precomputed feature matrix for the similarity search.
+# All numeric features are copied out of pandas once at load time into a
+# contiguous float32 matrix, so a similarity search is essentially one
+# matrix-vector product instead of a DataFrame round-trip.
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# memory budget for all chunks of the reference x candidate distance block
+# being computed at the same time
+CHUNK_BYTES = 64 * 1024 * 1024
+# bytes per block element: float32 distance and int64 argpartition index
+BLOCK_ELEMENT_BYTES = 12
+
+# feature subsets kept with their gathered matrix (least recently used
+# ones are dropped, each costs a copy of its columns)
+SUBSET_CACHE_SIZE = 4
+
+# relative tolerance below which a squared distance from the expanded
+# formula is recomputed exactly (cancellation of nearly equal rows)
+REFINE_TOLERANCE = 1e-2
+
+
+class FeatureMatrix:
+    """
+    Contiguous float32 matrix of the numeric feature columns.
+
+    Missing values are replaced by 0 before centering, like the old
+    fillna(0), so a search ranks them as real zeros. The matrix is
+    stored column-centered, which keeps the expanded euclidean formula
+    precise in float32; cosine distances add the column means back with
+    one extra dot product. The last SUBSET_CACHE_SIZE feature subsets
+    used by a search are cached together with their row norms, so
+    repeated searches on the same features only cost one matrix-vector
+    product.
+    """
+
+    def __init__(self, arrays, columns, n_rows):
+        """
+        arrays maps every name in columns to a 1d array of n_rows values
+        (a DataFrame works as well).
+        """
+        self.columns = list(columns)
+        self.positions = {col: i for i, col in enumerate(self.columns)}
+
+        values = np.empty((n_rows, len(self.columns)), dtype=np.float32)
+        for i, col in enumerate(self.columns):
+            values[:, i] = np.asarray(arrays[col], dtype=np.float32)
+
+        values[np.isnan(values)] = 0
+        raw_sq_norms = np.einsum('ij,ij->i', values, values)
+
+        self.means = values.mean(axis=0, dtype=np.float64).astype(np.float32)
+        values -= self.means
+        self.values = values
+        self.sq_norms = np.einsum('ij,ij->i', values, values)
+        self.norms = np.sqrt(raw_sq_norms)
+        self._subsets = OrderedDict()
+        self._subsets_lock = threading.Lock()
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def subset(self, features):
+        """
+        Return (centered matrix, its squared row norms, raw row norms,
+        column means) for the given features.
+        """
+        key = tuple(features)
+        if key == tuple(self.columns):
+            return (self.values, self.sq_norms, self.norms, self.means)
+        with self._subsets_lock:
+            entry = self._subsets.get(key)
+            if entry is not None:
+                self._subsets.move_to_end(key)
+                return entry
+
+        cols = [self.positions[f] for f in features]
+        sub = np.ascontiguousarray(self.values[:, cols])
+        means = self.means[cols]
+        sq = np.einsum('ij,ij->i', sub, sub)
+        raw = sub + means
+        norms = np.sqrt(np.einsum('ij,ij->i', raw, raw))
+        entry = (sub, sq, norms, means)
+
+        with self._subsets_lock:
+            self._subsets[key] = entry
+            while len(self._subsets) > SUBSET_CACHE_SIZE:
+                self._subsets.popitem(last=False)
+        return entry
+
+    def vectors(self, features, rows):
+        """
+        Raw (uncentered) feature vectors of the given rows.
+        """
+        sub, _, _, means = self.subset(features)
+        return sub[rows] + means
+
+    def euclidean(self, ref_row, features, rows=None):
+        """
+        Euclidean distances of rows (default: all) to the row ref_row.
+        """
+        sub, sq, _, _ = self.subset(features)
+        ref = sub[ref_row]
+        X = sub if rows is None else sub[rows]
+        sq_x = sq if rows is None else sq[rows]
+
+        # |x - r|^2 = |x|^2 - 2 x.r + |r|^2, one BLAS gemv
+        d2 = sq_x - 2 * (X @ ref) + sq[ref_row]
+
+        # nearly identical rows lose precision in the expansion,
+        # recompute those few directly
+        close = d2 <= REFINE_TOLERANCE * (sq_x + sq[ref_row])
+        if np.any(close):
+            diff = X[close] - ref
+            d2[close] = np.einsum('ij,ij->i', diff, diff)
+
+        np.maximum(d2, 0, out=d2)
+        return np.sqrt(d2)
+
+    def cosine(self, ref_row, features, rows=None):
+        """
+        Cosine distances of rows (default: all) to the row ref_row.
+        Rows with zero norm get similarity 0 (distance 1), like sklearn.
+        """
+        sub, _, norms, means = self.subset(features)
+        ref = sub[ref_row] + means
+        X = sub if rows is None else sub[rows]
+        norms_x = norms if rows is None else norms[rows]
+
+        # (x_c + mean).r = x_c.r + mean.r
+        dots = X @ ref + means @ ref
+        denom = norms_x * norms[ref_row]
+        sim = np.zeros(len(X), dtype=np.float32)
+        np.divide(dots, denom, out=sim, where=denom > 0)
+        return np.clip(1 - sim, 0, 2)
+
+    def batch_top_k(self, references, features, k, metric='euclidean',
+                    rows=None, self_rows=None, chunk_bytes=CHUNK_BYTES,
+                    workers=None):
+        """
+        k nearest candidate rows for every reference vector.
+
+        references is an (m, len(features)) array of raw feature
+        vectors (see vectors()), rows the candidate
+        row positions (default: all). self_rows optionally gives, per
+        reference, its position within the candidates (-1 if absent) so
+        it is excluded from its own neighbour list.
+        The distance block is computed in chunks spread over a thread
+        pool of workers (BLAS releases the GIL), sized so all chunks in
+        flight together use at most about chunk_bytes.
+
+        Returns (neighbours, distances), both (m, k): sparse top-k lists
+        with neighbours given as row positions in the full matrix.
+        """
+        sub, sq, norms, means = self.subset(features)
+        X = sub if rows is None else sub[rows]
+        sq_x = sq if rows is None else sq[rows]
+        norms_x = norms if rows is None else norms[rows]
+        candidate_rows = (
+            np.arange(len(sub)) if rows is None else np.asarray(rows)
+        )
+
+        R = np.ascontiguousarray(references, dtype=np.float32)
+        m = len(R)
+        k = min(k, len(X) - (1 if self_rows is not None else 0))
+        neighbours = np.empty((m, max(k, 0)), dtype=np.int64)
+        distances = np.empty((m, max(k, 0)), dtype=np.float32)
+        if m == 0 or k <= 0:
+            return neighbours, distances
+
+        workers = workers or os.cpu_count() or 1
+        chunk = max(
+            1, chunk_bytes // (BLOCK_ELEMENT_BYTES * len(X) * workers)
+        )
+
+        def run(start):
+            stop = min(start + chunk, m)
+            block = self._distance_block(
+                R[start:stop], X, sq_x, norms_x, means, metric
+            )
+            if self_rows is not None:
+                own = np.asarray(self_rows[start:stop])
+                hit = np.flatnonzero(own >= 0)
+                block[hit, own[hit]] = np.inf
+
+            part = np.argpartition(block, k - 1, axis=1)[:, :k]
+            part_dist = np.take_along_axis(block, part, axis=1)
+            order = np.argsort(part_dist, axis=1, kind='stable')
+            neighbours[start:stop] = candidate_rows[
+                np.take_along_axis(part, order, axis=1)
+            ]
+            distances[start:stop] = np.take_along_axis(
+                part_dist, order, axis=1
+            )
+
+        starts = range(0, m, chunk)
+        if workers == 1 or len(starts) == 1:
+            for start in starts:
+                run(start)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # list() re-raises exceptions from the workers
+                list(pool.map(run, starts))
+
+        return neighbours, distances
+
+    @staticmethod
+    def _distance_block(R, X, sq_x, norms_x, means, metric):
+        """
+        Dense (len(R), len(X)) distance block for one chunk of raw
+        reference vectors R against the centered candidates X.
+        Everything works in place on the gemm result, so the block is
+        the only temporary of its size.
+        """
+        if metric == 'cosine':
+            sim = R @ X.T
+            sim += (R @ means)[:, None]
+            # zero norms get similarity 0
+            norms_r = np.linalg.norm(R, axis=1)
+            inv_r = np.zeros_like(norms_r)
+            np.divide(1, norms_r, out=inv_r, where=norms_r > 0)
+            inv_x = np.zeros_like(norms_x)
+            np.divide(1, norms_x, out=inv_x, where=norms_x > 0)
+            sim *= inv_r[:, None]
+            sim *= inv_x[None, :]
+            np.subtract(1, sim, out=sim)
+            return np.clip(sim, 0, 2, out=sim)
+
+        R = R - means
+        sq_r = np.einsum('ij,ij->i', R, R)
+
+        # in place on the gemm result to avoid block-sized temporaries
+        d2 = R @ X.T
+        d2 *= -2
+        d2 += sq_x[None, :]
+        d2 += sq_r[:, None]
+
+        # row by row, the bound is one row long
+        bound_x = REFINE_TOLERANCE * sq_x
+        for i in range(len(R)):
+            j = np.flatnonzero(
+                d2[i] <= bound_x + REFINE_TOLERANCE * sq_r[i]
+            )
+            if len(j):
+                diff = X[j] - R[i]
+                d2[i, j] = np.einsum('ij,ij->i', diff, diff)
+
+        np.maximum(d2, 0, out=d2)
+        return np.sqrt(d2, out=d2)
@@ -0,0 +1,110 @@
+# Nearest-neighbour index for the similarity search.
+# A KD-tree is built over the feature matrix for one feature subset and
+# metric and pickled next to the column cache, so later launches can query
+# it without rebuilding.
+
+import hashlib
+import os
+import pickle
+
+import numpy as np
+
+INDEX_VERSION = 2
+METRICS = ('euclidean', 'cosine')
+
+
+def top_k(distances, k):
+    """
+    Positions of the k smallest distances in ascending order
+    (partial selection instead of a full sort).
+    """
+    k = min(k, len(distances))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    part = np.argpartition(distances, k - 1)[:k]
+    return part[np.argsort(distances[part], kind='stable')]
+
+
+class KnnIndex:
+    """
+    KD-tree over one feature subset of a FeatureMatrix.
+
+    For the cosine metric the tree is built over unit-length rows, where
+    the euclidean order equals the cosine order. Rows with zero norm have
+    no direction and are left out of the cosine tree.
+    """
+
+    def __init__(self, matrix, features, metric='euclidean', leaf_size=40):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        self.features = list(features)
+        self.metric = metric
+
+        sub, _, norms, means = matrix.subset(self.features)
+        # euclidean distances do not change under the centering of the
+        # feature matrix, so the tree is built over the centered rows
+        self.means = means
+        if metric == 'cosine':
+            self.rows = np.flatnonzero(norms > 0)
+            points = (sub[self.rows] + means) / norms[self.rows, None]
+        else:
+            self.rows = np.arange(len(sub))
+            points = sub
+        # imported here, sklearn alone takes longer to import than the
+        # whole startup of the browser
+        from sklearn.neighbors import KDTree
+        self.tree = KDTree(points, leaf_size=leaf_size)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def query(self, vector, k):
+        """
+        Return the row positions of the k nearest rows to the raw
+        feature vector.
+        """
+        vector = np.asarray(vector, dtype=np.float64)
+        if self.metric == 'cosine':
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector = vector / norm
+        else:
+            vector = vector - self.means
+        k = min(k, len(self.rows))
+        if k == 0:
+            return np.empty(0, dtype=np.intp)
+        idx = self.tree.query(vector[None, :], k=k, return_distance=False)
+        return self.rows[idx[0]]
+
+    @staticmethod
+    def filename(features, metric):
+        digest = hashlib.sha1('\0'.join(features).encode()).hexdigest()
+        return f"knn_{metric}_{digest[:16]}.pkl"
+
+    def save(self, path, signature):
+        with open(path, 'wb') as f:
+            pickle.dump(
+                {'version': INDEX_VERSION, 'source': signature, 'index': self},
+                f, protocol=pickle.HIGHEST_PROTOCOL
+            )
+
+    @staticmethod
+    def load(path, signature):
+        """
+        Load a pickled index, or return None if it is missing or stale.
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                payload = pickle.load(f)
+        except Exception:
+            # also pickles of another sklearn version (AttributeError,
+            # ModuleNotFoundError, ...), the index is built again
+            return None
+        if not isinstance(payload, dict) or \
+                payload.get('version') != INDEX_VERSION:
+            return None
+        if payload.get('source') != signature:
+            return None
+        return payload['index']
@@ -0,0 +1,34 @@
+from PySide6.QtCore import QThread, Signal
+
+from browser.data_model import SampleDataModel
+
+
+class DataLoader(QThread):
+    """
+    Builds the SampleDataModel on a worker thread.
+
+    progress(stage, done, total) is forwarded from the data model (see
+    SampleDataModel) and keeps arriving after loaded, while the sample
+    paths, the remaining columns and the feature matrix are prepared in
+    the background.
+    """
+
+    progress = Signal(str, int, int)
+    loaded = Signal(object)
+    failed = Signal(object)
+
+    def __init__(self, csv_path, samples_root=None, parent=None):
+        super().__init__(parent)
+        self.csv_path = csv_path
+        self.samples_root = samples_root
+
+    def run(self):
+        try:
+            model = SampleDataModel(
+                self.csv_path, progress=self.progress.emit,
+                samples_root=self.samples_root
+            )
+        except Exception as e:  # reported to the GUI thread
+            self.failed.emit(e)
+            return
+        self.loaded.emit(model)
@@ -0,0 +1,70 @@
+# Absolute paths of all sample files.
+# Resolved once per dataset load from the 'dir_path' and 'stem' columns, so
+# selecting a sample is an array lookup. Every sample directory is listed
+# once with os.scandir (in parallel) to find the files that are missing.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# directories listed at the same time
+SCAN_WORKERS = 16
+
+
+def sample_path(root, dir_path, stem):
+    """
+    Path of one sample file, dir_path like 'Kicks/Pack0'.
+    """
+    return os.path.join(root, *dir_path.split('/'), f"{stem}.wav")
+
+
+def _list_files(directory):
+    """
+    Names of the files in directory (empty if it does not exist).
+    """
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name for entry in entries if entry.is_file()}
+    except OSError:
+        return set()
+
+
+class PathIndex:
+    """
+    Sample file paths and their existence, aligned with the rows of the
+    sample table.
+
+    paths[row] is the absolute path of the row's .wav file (None if its
+    directory is unknown), missing[row] is True if that file does not
+    exist.
+    """
+
+    def __init__(self, root, stems, dir_paths, workers=SCAN_WORKERS):
+        self.root = os.path.abspath(root)
+        stems = np.asarray(stems, dtype=object)
+
+        # every directory is resolved and listed once
+        dirs = pd.Categorical(dir_paths)
+        directories = [
+            os.path.join(self.root, *d.split('/')) for d in dirs.categories
+        ]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            listings = list(pool.map(_list_files, directories))
+
+        codes = dirs.codes
+        paths = np.empty(len(stems), dtype=object)
+        missing = np.ones(len(stems), dtype=bool)
+        for row, (code, stem) in enumerate(zip(codes.tolist(), stems)):
+            if code < 0 or not isinstance(stem, str):
+                continue
+            name = f"{stem}.wav"
+            paths[row] = os.path.join(directories[code], name)
+            missing[row] = name not in listings[code]
+
+        self.paths = paths
+        self.missing = missing
+
+    def n_missing(self):
+        return int(self.missing.sum())
@@ -0,0 +1,220 @@
+# Waveform peak pyramids of sample files.
+# A file is summarized once as min, max and RMS per bin of BASE_BIN frames,
+# and again for bins FACTOR times as long, until a level has at most
+# TOP_BINS bins. All levels are stored as one float16 .npy sidecar per file,
+# named after its path, size and mtime, plus a small .json header. The
+# sidecars are memory-mapped for drawing, so a waveform at any zoom never
+# reads the audio again.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import soundfile as sf
+
+PEAKS_VERSION = 1
+# frames per bin of the finest level
+BASE_BIN = 64
+# bins of one level summarized by a bin of the next
+FACTOR = 4
+# bins of the coarsest level (at most)
+TOP_BINS = 512
+# frames read from the file at once, a multiple of BASE_BIN
+READ_BLOCK = BASE_BIN * 4096
+
+
+def peaks_dir_for(csv_path):
+    """
+    Return the default sidecar directory next to the CSV file.
+    """
+    base, _ = os.path.splitext(os.path.abspath(csv_path))
+    return base + '_peaks'
+
+
+def file_signature(file_path):
+    """
+    Path, size and mtime of a sample file, a changed file gets new peaks.
+    """
+    st = os.stat(file_path)
+    return {
+        'path': os.path.abspath(file_path),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+    }
+
+
+def sidecar_name(signature):
+    return hashlib.sha1(
+        json.dumps([PEAKS_VERSION, signature], sort_keys=True).encode()
+    ).hexdigest()
+
+
+def _summarize(block):
+    """
+    min, max, sum of squares and sample count per BASE_BIN frames of a
+    (frames, channels) block, all channels together.
+    """
+    frames, channels = block.shape
+    bins = -(-frames // BASE_BIN)
+    pad = bins * BASE_BIN - frames
+    # repeating the last frame keeps min and max
+    edge = np.pad(block, ((0, pad), (0, 0)), mode='edge')
+    edge = edge.reshape(bins, BASE_BIN * channels)
+    squares = np.pad(block.astype(np.float64) ** 2, ((0, pad), (0, 0)))
+    counts = np.full(bins, BASE_BIN * channels)
+    counts[-1] -= pad * channels
+    return (
+        edge.min(axis=1), edge.max(axis=1),
+        squares.reshape(bins, -1).sum(axis=1), counts
+    )
+
+
+def _coarser(mins, maxs, sums, counts):
+    """
+    The next level: FACTOR bins combined into one.
+    """
+    pad = -len(mins) % FACTOR
+    mins = np.pad(mins, (0, pad), mode='edge').reshape(-1, FACTOR)
+    maxs = np.pad(maxs, (0, pad), mode='edge').reshape(-1, FACTOR)
+    sums = np.pad(sums, (0, pad)).reshape(-1, FACTOR)
+    counts = np.pad(counts, (0, pad)).reshape(-1, FACTOR)
+    return (
+        mins.min(axis=1), maxs.max(axis=1),
+        sums.sum(axis=1), counts.sum(axis=1)
+    )
+
+
+def build_peaks(file_path, cache_dir):
+    """
+    Compute the peak pyramid of file_path and write its sidecar to
+    cache_dir. Runs in a worker process, returns file_path.
+    """
+    signature = file_signature(file_path)
+    parts = []
+    with sf.SoundFile(file_path) as f:
+        samplerate, frames, channels = f.samplerate, f.frames, f.channels
+        while True:
+            block = f.read(READ_BLOCK, dtype='float32', always_2d=True)
+            if len(block) == 0:
+                break
+            parts.append(_summarize(block))
+
+    if parts:
+        level = tuple(np.concatenate(values) for values in zip(*parts))
+    else:
+        level = (np.zeros(0), np.zeros(0), np.zeros(0), np.zeros(0, int))
+
+    levels, rows, offset, bin_frames = [], [], 0, BASE_BIN
+    while True:
+        mins, maxs, sums, counts = level
+        rms = np.sqrt(sums / np.maximum(counts, 1))
+        rows.append(np.column_stack((mins, maxs, rms)))
+        levels.append({
+            'offset': offset, 'bins': len(mins), 'bin_frames': bin_frames
+        })
+        offset += len(mins)
+        if len(mins) <= TOP_BINS:
+            break
+        level = _coarser(*level)
+        bin_frames *= FACTOR
+
+    header = {
+        'version': PEAKS_VERSION,
+        'source': signature,
+        'samplerate': samplerate,
+        'frames': frames,
+        'channels': channels,
+        'levels': levels,
+    }
+
+    # written under temporary names, the header last, so a sidecar that
+    # is being written never looks valid
+    os.makedirs(cache_dir, exist_ok=True)
+    base = os.path.join(cache_dir, sidecar_name(signature))
+    with open(base + '.npy.tmp', 'wb') as f:
+        np.save(f, np.concatenate(rows).astype(np.float16))
+    os.replace(base + '.npy.tmp', base + '.npy')
+    with open(base + '.json.tmp', 'w') as f:
+        json.dump(header, f)
+    os.replace(base + '.json.tmp', base + '.json')
+    return file_path
+
+
+class Peaks:
+    """
+    Memory-mapped peak pyramid of one sample file.
+
+    data holds (min, max, rms) rows of all levels, levels their offset,
+    number of bins and frames per bin, finest first.
+    """
+
+    def __init__(self, header, data):
+        self.samplerate = header['samplerate']
+        self.frames = header['frames']
+        self.levels = header['levels']
+        self.data = data
+
+    @property
+    def duration(self):
+        return self.frames / self.samplerate
+
+    def envelope(self, start, end, max_bins):
+        """
+        Bin start times and (min, max, rms) rows covering start..end
+        seconds, from the finest level with at most max_bins bins in that
+        range (the coarsest if none has).
+        """
+        start = min(max(start, 0.0), self.duration) * self.samplerate
+        end = min(max(end, 0.0), self.duration) * self.samplerate
+        span = max(end - start, 1.0)
+
+        level = self.levels[-1]
+        for candidate in self.levels:
+            if span / candidate['bin_frames'] <= max_bins:
+                level = candidate
+                break
+
+        bin_frames = level['bin_frames']
+        first = int(start // bin_frames)
+        last = min(int(-(-end // bin_frames)), level['bins'])
+        rows = self.data[level['offset'] + first:level['offset'] + last]
+        times = np.arange(first, first + len(rows)) * (
+            bin_frames / self.samplerate
+        )
+        return times, np.asarray(rows, dtype=np.float32)
+
+
+class PeakCache:
+    """
+    Peak sidecars in cache_dir. load() only returns peaks built from the
+    current version of a file.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def _base(self, file_path):
+        return os.path.join(
+            self.cache_dir, sidecar_name(file_signature(file_path))
+        )
+
+    def load(self, file_path):
+        """
+        Peaks of a file, or None if they are not built yet.
+        """
+        try:
+            base = self._base(file_path)
+            with open(base + '.json', 'r') as f:
+                header = json.load(f)
+            if header.get('version') != PEAKS_VERSION:
+                return None
+            return Peaks(header, np.load(base + '.npy', mmap_mode='r'))
+        except (OSError, ValueError):
+            return None
+
+    def __contains__(self, file_path):
+        try:
+            return os.path.exists(self._base(file_path) + '.json')
+        except OSError:
+            return False
@@ -0,0 +1,88 @@
+# Colormaps for the scatter plot.
+# Normalized values are mapped to colors with a NumPy lookup table, and every
+# color level has one shared QBrush, so a plot update never creates brushes
+# per point. Reusing the same brush objects also keeps pyqtgraph's symbol
+# atlas small.
+
+import numpy as np
+import pyqtgraph as pg
+
+# color levels per gradient
+PALETTE_SIZE = 256
+
+# exponent applied to normalized values, smoother gradient for visibility
+GAMMA = 0.6
+
+_palettes = {}
+
+
+def lut(name):
+    """
+    RGBA lookup table of a gradient with PALETTE_SIZE levels.
+    """
+    t = np.linspace(0, 1, PALETTE_SIZE)
+    lut = np.empty((PALETTE_SIZE, 4), dtype=np.uint8)
+    if name == 'distance':
+        # Blue (0,0,255) → Red (255,0,0)
+        lut[:, 0] = (t * 255).astype(np.uint8)
+        lut[:, 1] = 0
+        lut[:, 2] = ((1 - t) * 255).astype(np.uint8)
+    elif name == 'feature':
+        # Blue (0,0,255) → Orange (255,165,0)
+        lut[:, 0] = (t * 255).astype(np.uint8)
+        lut[:, 1] = (t * 165).astype(np.uint8)
+        lut[:, 2] = ((1 - t) * 255).astype(np.uint8)
+    else:
+        raise ValueError(f"Unknown gradient: {name}")
+    lut[:, 3] = 200
+    return lut
+
+
+def palette(name):
+    """
+    Object array of the PALETTE_SIZE shared brushes of a gradient.
+    """
+    if name not in _palettes:
+        brushes = np.empty(PALETTE_SIZE, dtype=object)
+        brushes[:] = [pg.mkBrush(*rgba) for rgba in lut(name).tolist()]
+        _palettes[name] = brushes
+    return _palettes[name]
+
+
+def normalize(values):
+    """
+    Scale values to 0..1 over their finite range. NaNs stay NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    if not np.any(valid):
+        return np.full(len(values), np.nan)
+    lo = np.min(values[valid])
+    hi = np.max(values[valid])
+    return np.clip((values - lo) / (hi - lo + 1e-9), 0, 1)
+
+
+def levels(norm):
+    """
+    Palette level of every normalized value (NaNs give level 0).
+    """
+    scaled = np.nan_to_num(norm, nan=0.0) ** GAMMA
+    return np.rint(scaled * (PALETTE_SIZE - 1)).astype(np.intp)
+
+
+def brushes(norm, name, missing=None):
+    """
+    Object array with one shared brush per value of norm. Values that are
+    NaN get the missing brush (default: the lowest level).
+    """
+    result = palette(name)[levels(norm)]
+    if missing is not None:
+        result[np.isnan(norm)] = missing
+    return result
+
+
+def uniform(n, brush):
+    """
+    Object array repeating a single brush n times.
+    """
+    return np.full(n, brush, dtype=object)
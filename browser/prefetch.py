@@ -0,0 +1,75 @@
+# Decodes the samples a user is likely to play next into the AudioCache.
+# Requests come from the GUI thread on every selection change; a single
+# worker decodes one file at a time, so prefetching never competes with
+# itself for the disk, and a newer request cancels the older one.
+
+from concurrent.futures import ThreadPoolExecutor
+
+import soundfile as sf
+
+from browser.audio_cache import join_blocks
+
+# decoded bytes prefetched per request
+PREFETCH_BYTES = 64 * 1024 * 1024
+# frames decoded between two checks for a newer request
+DECODE_BLOCK = 65536
+
+
+class Prefetcher:
+    """
+    Background queue filling an AudioCache.
+
+    prefetch(paths) supersedes the previous request. Paths are decoded in
+    the given order until max_bytes of decoded audio (at most a quarter
+    of the cache, so the cache is not flushed by guesses) are used up.
+    Files already cached are skipped, a superseded request stops within
+    DECODE_BLOCK frames.
+    """
+
+    def __init__(self, cache, max_bytes=PREFETCH_BYTES):
+        self.cache = cache
+        self.max_bytes = min(max_bytes, cache.max_bytes // 4)
+        self.generation = 0
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def prefetch(self, paths):
+        self.generation += 1
+        self._executor.submit(self._run, self.generation, list(paths))
+
+    def cancel(self):
+        self.generation += 1
+
+    def _run(self, generation, paths):
+        budget = self.max_bytes
+        for path in paths:
+            if generation != self.generation:
+                return
+            try:
+                budget -= self._load(generation, path, budget)
+            except Exception as e:
+                print(f"Error prefetching {path}: {e}")
+
+    def _load(self, generation, path, budget):
+        """
+        Decode one file into the cache if it fits into budget, returns
+        the bytes used.
+        """
+        if path in self.cache:
+            return 0
+        key = self.cache.key(path)
+        with sf.SoundFile(path) as f:
+            size = f.frames * f.channels * 4
+            if size > budget:
+                return 0
+            blocks = []
+            while True:
+                if generation != self.generation:
+                    return 0
+                block = f.read(DECODE_BLOCK, dtype='float32', always_2d=True)
+                if len(block) == 0:
+                    break
+                blocks.append(block)
+            self.cache.put(
+                key, (join_blocks(blocks, f.channels), f.samplerate)
+            )
+        return size
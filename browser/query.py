@@ -0,0 +1,128 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from PySide6.QtCore import QObject, QTimer, Signal
+
+# quiet time after the last keystroke before a query starts
+DEBOUNCE_MS = 150
+
+
+class FilterQuery(QObject):
+    """
+    Runs the regex filter of the search box on a worker thread.
+
+    submit() restarts a debounce timer, when it fires the latest pattern
+    is matched with SampleDataModel.match_rows() on a single worker
+    thread. Every submit() starts a new generation: queued queries of an
+    older generation are skipped and their results dropped, so ready only
+    delivers the rows of the latest pattern. The current filter of the
+    data model is left to the receiver (set_filter() on the GUI thread).
+    """
+
+    ready = Signal(object)
+    # worker -> GUI thread, (generation, rows)
+    _finished = Signal(int, object)
+
+    def __init__(self, data_model, delay_ms=DEBOUNCE_MS, parent=None):
+        super().__init__(parent)
+        self.data_model = data_model
+        self.generation = 0
+        self._pattern = ''
+        self._hide_missing = False
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay_ms)
+        self._timer.timeout.connect(self._start)
+        self._finished.connect(self._publish)
+
+    def submit(self, pattern, hide_missing=False):
+        """
+        Queue pattern, superseding all earlier patterns. With
+        hide_missing, samples whose file does not exist are left out.
+        """
+        self.generation += 1
+        self._pattern = pattern
+        self._hide_missing = hide_missing
+        self._timer.start()
+
+    def _start(self):
+        self._executor.submit(
+            self._run, self.generation, self._pattern, self._hide_missing
+        )
+
+    def _run(self, generation, pattern, hide_missing):
+        if generation != self.generation:
+            return
+        rows = self.data_model.match_rows(
+            pattern, hide_missing=hide_missing
+        )
+        if rows is None or generation != self.generation:
+            return
+        self._finished.emit(generation, rows)
+
+    def _publish(self, generation, rows):
+        if generation == self.generation:
+            self.ready.emit(rows)
+
+
+class SimilarityQuery(QObject):
+    """
+    Runs similarity searches (SampleDataModel.similarity()) on a worker
+    thread.
+
+    submit() starts a search right away and supersedes the previous one,
+    cancel() only supersedes. A superseded search stops at its next chunk
+    of rows. progress(done, total) and finished(result) are only emitted
+    for the latest search, result is (rows, distance) or None if the
+    reference is not in the rows. Publishing the result is left to the
+    receiver.
+    """
+
+    progress = Signal(int, int)
+    finished = Signal(object)
+    # worker -> GUI thread, with the generation
+    _progressed = Signal(int, int, int)
+    _finished = Signal(int, object)
+
+    def __init__(self, data_model, parent=None):
+        super().__init__(parent)
+        self.data_model = data_model
+        self.generation = 0
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._progressed.connect(self._publish_progress)
+        self._finished.connect(self._publish)
+
+    def submit(self, reference_file, features, metric, rows):
+        """
+        Search the rows closest to reference_file.
+        """
+        self.generation += 1
+        self._executor.submit(
+            self._run, self.generation, reference_file, list(features),
+            metric, rows
+        )
+
+    def cancel(self):
+        self.generation += 1
+
+    def _run(self, generation, reference_file, features, metric, rows):
+        if generation != self.generation:
+            return
+        result = self.data_model.similarity(
+            reference_file, features, metric, rows,
+            progress=lambda done, total: self._progressed.emit(
+                generation, done, total
+            ),
+            cancelled=lambda: generation != self.generation
+        )
+        if generation == self.generation:
+            self._finished.emit(generation, result)
+
+    def _publish_progress(self, generation, done, total):
+        if generation == self.generation:
+            self.progress.emit(done, total)
+
+    def _publish(self, generation, result):
+        if generation == self.generation:
+            self.finished.emit(result)
@@ -0,0 +1,52 @@
+# Single producer, single consumer ring buffer of audio frames.
+# The producer only moves write_pos and the consumer only moves read_pos,
+# both are running frame counters (never wrapped), so neither side needs a
+# lock: a counter is published after the frames it covers are copied.
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed size float32 buffer of (frames, channels) audio.
+
+    write() is called from one thread, read() from another. eof is set by
+    the producer after its last write().
+    """
+
+    def __init__(self, frames, channels):
+        self.data = np.zeros((frames, channels), dtype=np.float32)
+        self.frames = frames
+        self.write_pos = 0
+        self.read_pos = 0
+        self.eof = False
+
+    def available(self):
+        return self.write_pos - self.read_pos
+
+    def space(self):
+        return self.frames - (self.write_pos - self.read_pos)
+
+    def write(self, block):
+        """
+        Copy as many frames of block as fit, returns their number.
+        """
+        n = min(len(block), self.space())
+        start = self.write_pos % self.frames
+        first = min(n, self.frames - start)
+        self.data[start:start + first] = block[:first]
+        self.data[:n - first] = block[first:n]
+        self.write_pos += n
+        return n
+
+    def read(self, out):
+        """
+        Copy up to len(out) frames into out, returns their number.
+        """
+        n = min(len(out), self.available())
+        start = self.read_pos % self.frames
+        first = min(n, self.frames - start)
+        out[:first] = self.data[start:start + first]
+        out[first:n] = self.data[:n - first]
+        self.read_pos += n
+        return n
@@ -0,0 +1,44 @@
+from collections import namedtuple
+
+# where a sample is shown, None for views it is not in
+Location = namedtuple(
+    'Location', ['original_idx', 'main_row', 'sorted_row', 'point']
+)
+
+
+class RowIndex:
+    """
+    Finds a sample in all views of the main window: main table, sorted
+    output table and scatter plot.
+
+    stem_rows maps stems to row positions in df_all (see SampleDataModel).
+    Each view keeps the inverse of its own row order, rebuilt once after
+    it is sorted or filtered (PandasTableModel.view_row(),
+    ScatterLayer.point_of()), so every lookup is O(1).
+    """
+
+    def __init__(self, stem_rows, table_model, sorted_table_model,
+                 scatter_layer):
+        self.stem_rows = stem_rows
+        self.table_model = table_model
+        self.sorted_table_model = sorted_table_model
+        self.scatter_layer = scatter_layer
+
+    def locate(self, stem):
+        """
+        Location of the sample with the given stem.
+        """
+        return self.locate_index(self.stem_rows.get(stem))
+
+    def locate_index(self, original_idx):
+        """
+        Location of a row position in df_all.
+        """
+        if original_idx is None:
+            return Location(None, None, None, None)
+        return Location(
+            original_idx,
+            self.table_model.view_row(original_idx),
+            self.sorted_table_model.view_row(original_idx),
+            self.scatter_layer.point_of(original_idx),
+        )
@@ -0,0 +1,431 @@
+# Scatter plot layer of the main window.
+# Keeps the arrays of the plotted view (axis values, brushes) cached per
+# view version of the data model, so changing an axis or the color feature
+# only updates the part of the plot that actually changed. Selection and
+# clicks are resolved from the same arrays instead of pyqtgraph's spot items.
+# When too many points are visible, a density image is shown instead.
+
+import numpy as np
+import pyqtgraph as pg
+from PySide6.QtCore import QRectF
+
+from browser import plot_colors
+
+# cells per axis of the click lookup grid
+GRID_SIZE = 256
+
+# above this many points in the visible range the plot shows a density
+# image instead of individual points
+LOD_MAX_POINTS = 30000
+
+# bins per axis of the density image
+DENSITY_BINS = 256
+
+# share of the visible range added on each side when loading the points
+# around it
+WINDOW_MARGIN = 0.25
+
+
+def _bounds(values):
+    """
+    (min, max) of the finite values, or (None, None).
+    """
+    finite = values[np.isfinite(values)]
+    if len(finite) == 0:
+        return (None, None)
+    return (float(finite.min()), float(finite.max()))
+
+
+class PointGrid:
+    """
+    Uniform grid over the finite points of a plot, for finding the point
+    under the mouse without looking at all of them.
+
+    Points are bucketed by cell and stored as one array sorted by cell
+    with offsets per cell (cell = column * GRID_SIZE + row).
+    """
+
+    def __init__(self, x, y, size=GRID_SIZE):
+        self.x = x
+        self.y = y
+        self.size = size
+        finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+        if len(finite) == 0:
+            self.points = finite
+            self.offsets = np.zeros(size * size + 1, dtype=np.int64)
+            self.x0 = self.y0 = 0.0
+            self.cell_w = self.cell_h = 1.0
+            return
+
+        fx = x[finite].astype(np.float64)
+        fy = y[finite].astype(np.float64)
+        self.x0 = fx.min()
+        self.y0 = fy.min()
+        # empty extents get unit cells
+        self.cell_w = (fx.max() - self.x0) / size or 1.0
+        self.cell_h = (fy.max() - self.y0) / size or 1.0
+
+        cells = self._col(fx) * size + self._row(fy)
+        order = np.argsort(cells, kind='stable')
+        self.points = finite[order]
+        self.offsets = np.searchsorted(
+            cells[order], np.arange(size * size + 1)
+        )
+
+    def _col(self, x):
+        col = np.floor((x - self.x0) / self.cell_w).astype(np.int64)
+        return np.clip(col, 0, self.size - 1)
+
+    def _row(self, y):
+        row = np.floor((y - self.y0) / self.cell_h).astype(np.int64)
+        return np.clip(row, 0, self.size - 1)
+
+    def nearest(self, x, y, rx, ry):
+        """
+        Index of the point closest to (x, y) within the ellipse with radii
+        rx, ry (e.g. a few pixels in data units), or None.
+        """
+        c0, c1 = self._col(np.array([x - rx, x + rx]))
+        r0, r1 = self._row(np.array([y - ry, y + ry]))
+        # rows of one column are contiguous cells
+        parts = [
+            self.points[self.offsets[c * self.size + r0]:
+                        self.offsets[c * self.size + r1 + 1]]
+            for c in range(c0, c1 + 1)
+        ]
+        candidates = np.concatenate(parts)
+        if len(candidates) == 0:
+            return None
+
+        d = (((self.x[candidates] - x) / rx) ** 2 +
+             ((self.y[candidates] - y) / ry) ** 2)
+        best = np.argmin(d)
+        if d[best] > 1:
+            return None
+        return int(candidates[best])
+
+
+class PointsItem(pg.ScatterPlotItem):
+    """
+    ScatterPlotItem that leaves mouse clicks to the plot. Its own click
+    handling creates a spot item for every point to find the clicked
+    ones, ScatterLayer.point_at() answers that from a grid.
+
+    If full_bounds ((xmin, xmax), (ymin, ymax)) is set, it is reported as
+    the data bounds, so auto-range covers all points of the view even if
+    only some of them are loaded.
+    """
+
+    full_bounds = None
+
+    def mouseClickEvent(self, ev):
+        ev.ignore()
+
+    def dataBounds(self, ax, frac=1.0, orthoRange=None):
+        if self.full_bounds is not None:
+            return self.full_bounds[ax]
+        return super().dataBounds(ax, frac, orthoRange)
+
+
+class ScatterLayer:
+    """
+    Draws the current view of a SampleDataModel into a PointsItem.
+
+    Column values for the view rows and brush arrays are cached until the
+    view version of the data model changes (new filter or distances). An
+    update then only touches what differs from the plotted state: a new
+    view redraws all points, a new axis moves the points, a new color
+    only replaces the brushes.
+
+    The color is None (uniform), ('distance', None) or
+    ('feature', column name).
+
+    Plot points are the view rows. The row position in df_all of every
+    point is known from the view, the reverse mapping and a grid over the
+    plotted positions are built on first use.
+
+    Views with more than LOD_MAX_POINTS points are drawn by level of
+    detail from the visible range (see set_view_range()). While more than
+    LOD_MAX_POINTS points are visible, the density ImageItem shows a 2D
+    histogram of the visible range: bins are tinted with the mean color of
+    their points, the alpha grows with the log of the count. Zoomed in
+    further, only the points in a window around the visible range are
+    loaded into the scatter item. Clicks are resolved the same way in
+    all modes.
+    """
+
+    def __init__(self, scatter, density, data_model):
+        self.scatter = scatter
+        self.density = density
+        self.data_model = data_model
+        self.default_brush = pg.mkBrush(0, 0, 255, 120)
+        self.missing_brush = pg.mkBrush(255, 255, 255, 200)
+
+        self.version = None
+        self.rows = np.empty(0, dtype=np.int64)
+        self._values = {}
+        self._brushes = {}
+        self._norms = {}
+        self._points = None
+        self._grid = None
+
+        self.view_range = None
+        self.lod = False
+        self.density.hide()
+
+        # plotted state, None if nothing is drawn
+        self.plotted_version = None
+        self.axes = None
+        self.color = None
+        # ((x0, x1), (y0, y1)) of the loaded points if only a window of
+        # a large view is loaded
+        self._window = None
+
+    def _sync(self):
+        """
+        Drop the caches if the view of the data model has changed.
+        """
+        if self.version == self.data_model.version:
+            return
+        self.version = self.data_model.version
+        self.rows = self.data_model.rows
+        self._values.clear()
+        self._brushes.clear()
+        self._norms.clear()
+        self._points = None
+        self._grid = None
+
+    def values(self, name):
+        """
+        Values of a column for the rows of the current view (cached).
+        """
+        self._sync()
+        if name not in self._values:
+            self._values[name] = self.data_model.column(name)[self.rows]
+        return self._values[name]
+
+    def has_values(self, name):
+        """
+        True if the column has any non-NaN value in the current view.
+        """
+        return bool(np.any(~np.isnan(self.values(name))))
+
+    def _norm(self, color):
+        """
+        Normalized color values of the view rows (cached).
+        """
+        self._sync()
+        if color not in self._norms:
+            name = 'distance' if color[0] == 'distance' else color[1]
+            self._norms[color] = plot_colors.normalize(self.values(name))
+        return self._norms[color]
+
+    def brushes(self, color):
+        """
+        Brush array for a color setting (cached).
+        """
+        self._sync()
+        if color not in self._brushes:
+            if color is None:
+                brushes = plot_colors.uniform(
+                    len(self.rows), self.default_brush
+                )
+            elif color[0] == 'distance':
+                brushes = plot_colors.brushes(self._norm(color), 'distance')
+            else:
+                # samples without a value are drawn white
+                brushes = plot_colors.brushes(
+                    self._norm(color), 'feature', missing=self.missing_brush
+                )
+            self._brushes[color] = brushes
+        return self._brushes[color]
+
+    @property
+    def large(self):
+        """
+        True if the view is drawn by level of detail.
+        """
+        return len(self.rows) > LOD_MAX_POINTS
+
+    def clear(self):
+        self.scatter.full_bounds = None
+        self.scatter.setData([])
+        self.plotted_version = None
+        self.axes = None
+        self.color = None
+        self._window = None
+        self._grid = None
+        self._show_points()
+
+    def update(self, x_col, y_col, color=None):
+        """
+        Show the current view with the given axes and color.
+        """
+        self._sync()
+        axes = (x_col, y_col)
+        x = self.values(x_col)
+        y = self.values(y_col)
+
+        if self.large:
+            if self.plotted_version != self.version or axes != self.axes:
+                # points are loaded by _refresh_lod()
+                self._window = None
+                self._grid = None
+                self.scatter.full_bounds = (_bounds(x), _bounds(y))
+                self.scatter.setData([])
+            elif color != self.color:
+                self._window = None
+        else:
+            self.scatter.full_bounds = None
+            if self.plotted_version != self.version or self._window:
+                self.scatter.setData(x=x, y=y, brush=self.brushes(color))
+            else:
+                if axes != self.axes:
+                    self._move(x, y)
+                    self._grid = None
+                if color != self.color:
+                    self.scatter.setBrush(self.brushes(color))
+            self._window = None
+
+        self.plotted_version = self.version
+        self.axes = axes
+        self.color = color
+        self._refresh_lod()
+
+    def _move(self, x, y):
+        """
+        Replace the point positions and keep everything else. There is
+        no public call for this in ScatterPlotItem, so this does what
+        setData() does after filling in the positions.
+        """
+        scatter = self.scatter
+        scatter.data['x'] = x
+        scatter.data['y'] = y
+        scatter.prepareGeometryChange()
+        scatter.informViewBoundsChanged()
+        scatter.bounds = [None, None]
+        scatter.invalidate()
+        scatter.sigPlotChanged.emit(scatter)
+
+    def set_view_range(self, x_range, y_range):
+        """
+        Visible range of the plot, decides between points and density.
+        """
+        self.view_range = (tuple(x_range), tuple(y_range))
+        self._refresh_lod()
+
+    def _show_points(self):
+        if self.lod:
+            self.scatter.setOpacity(1)
+            self.density.hide()
+            self.lod = False
+
+    def _refresh_lod(self):
+        if self.axes is None or self.view_range is None or not self.large:
+            self._show_points()
+            return
+
+        x_col, y_col = self.axes
+        x = self.values(x_col)
+        y = self.values(y_col)
+        (x0, x1), (y0, y1) = self.view_range
+        visible = np.flatnonzero((x >= x0) & (x <= x1) &
+                                 (y >= y0) & (y <= y1))
+        if len(visible) <= LOD_MAX_POINTS or x1 <= x0 or y1 <= y0:
+            self._show_points()
+            self._load_window()
+            return
+
+        bins = DENSITY_BINS
+        col = ((x[visible] - x0) * (bins / (x1 - x0))).astype(np.int64)
+        row = ((y[visible] - y0) * (bins / (y1 - y0))).astype(np.int64)
+        cells = np.minimum(col, bins - 1) * bins + np.minimum(row, bins - 1)
+        counts = np.bincount(cells, minlength=bins * bins)
+        filled = counts > 0
+
+        image = np.zeros((bins * bins, 4), dtype=np.uint8)
+        if self.color is None:
+            image[:, 2] = 255
+        else:
+            # mean palette level of the points in each bin
+            levels = plot_colors.levels(self._norm(self.color)[visible])
+            sums = np.bincount(cells, weights=levels, minlength=bins * bins)
+            mean = np.zeros(bins * bins, dtype=np.intp)
+            mean[filled] = np.rint(sums[filled] / counts[filled])
+            image[:, :3] = plot_colors.lut(self.color[0])[mean, :3]
+        alpha = np.log1p(counts) / np.log1p(counts.max())
+        image[:, 3] = np.where(filled, 60 + 195 * alpha, 0).astype(np.uint8)
+
+        # ImageItem images are indexed [x, y]
+        self.density.setImage(
+            image.reshape(bins, bins, 4), autoLevels=False, levels=(0, 255)
+        )
+        self.density.setRect(QRectF(x0, y0, x1 - x0, y1 - y0))
+        if not self.lod:
+            self.scatter.setOpacity(0)
+            self.density.show()
+            self.lod = True
+
+    def _load_window(self):
+        """
+        Load the points around the visible range into the scatter item,
+        unless the loaded window still covers it.
+        """
+        (x0, x1), (y0, y1) = self.view_range
+        if self._window is not None:
+            (wx0, wx1), (wy0, wy1) = self._window
+            if wx0 <= x0 and x1 <= wx1 and wy0 <= y0 and y1 <= wy1:
+                return
+
+        # a margin, so small pans do not reload
+        mx = (x1 - x0) * WINDOW_MARGIN
+        my = (y1 - y0) * WINDOW_MARGIN
+        window = ((x0 - mx, x1 + mx), (y0 - my, y1 + my))
+        (wx0, wx1), (wy0, wy1) = window
+
+        x_col, y_col = self.axes
+        x = self.values(x_col)
+        y = self.values(y_col)
+        inside = np.flatnonzero((x >= wx0) & (x <= wx1) &
+                                (y >= wy0) & (y <= wy1))
+        self.scatter.setData(
+            x=x[inside], y=y[inside], brush=self.brushes(self.color)[inside]
+        )
+        self._window = window
+
+    def point_of(self, original_idx):
+        """
+        Plot point of a row position in df_all, or None if it is not
+        plotted.
+        """
+        if self.axes is None or original_idx is None:
+            return None
+        if self._points is None:
+            self._points = np.full(len(self.data_model.df_all), -1)
+            self._points[self.rows] = np.arange(len(self.rows))
+        point = self._points[original_idx]
+        return int(point) if point >= 0 else None
+
+    def point_pos(self, original_idx):
+        """
+        Plotted (x, y) of a row position in df_all, or None.
+        """
+        point = self.point_of(original_idx)
+        if point is None:
+            return None
+        x_col, y_col = self.axes
+        return (float(self.values(x_col)[point]),
+                float(self.values(y_col)[point]))
+
+    def point_at(self, x, y, rx, ry):
+        """
+        Row position in df_all of the plotted point nearest to (x, y)
+        within the radii rx, ry, or None.
+        """
+        if self.axes is None:
+            return None
+        if self._grid is None:
+            x_col, y_col = self.axes
+            self._grid = PointGrid(self.values(x_col), self.values(y_col))
+        point = self._grid.nearest(x, y, rx, ry)
+        return None if point is None else int(self.rows[point])
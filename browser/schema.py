@@ -0,0 +1,74 @@
+# Compact dtypes for the sample table.
+# Applied once after parsing the CSV, so the column cache already stores
+# the compact columns.
+
+import ast
+
+import numpy as np
+import pandas as pd
+
+# string columns with at most this share of distinct values become
+# categoricals
+CATEGORY_MAX_RATIO = 0.5
+
+
+def parse_dir(value):
+    """
+    Turn a stringified directory list like "['a', 'b']" into 'a/b'.
+    """
+    try:
+        parts = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return np.nan
+    if not isinstance(parts, (list, tuple)):
+        return np.nan
+    return '/'.join(str(p) for p in parts)
+
+
+def compact_dtypes(df, progress=None):
+    """
+    Return df with float32 features, downcast integers, categoricals for
+    low-cardinality strings and the 'dir' list column parsed once into a
+    categorical 'dir_path' column.
+    progress(done, total) is called after every column.
+    """
+    data = {}
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        kind = series.dtype.kind
+
+        if col == 'dir' and kind == 'O':
+            # parse every distinct value once, not every row
+            paths = {v: parse_dir(v) for v in series.dropna().unique()}
+            data['dir_path'] = series.map(paths).astype('category')
+        elif kind == 'f':
+            data[col] = series.astype(np.float32)
+        elif kind in 'iu':
+            data[col] = pd.to_numeric(series, downcast='integer')
+        elif kind == 'O':
+            n_unique = series.nunique(dropna=True)
+            if n_unique <= CATEGORY_MAX_RATIO * max(len(series), 1):
+                data[col] = series.astype('category')
+            else:
+                data[col] = series
+        else:
+            data[col] = series
+
+        if progress is not None:
+            progress(i + 1, len(df.columns))
+
+    return pd.DataFrame(data, index=df.index)
+
+
+def memory_report(df):
+    """
+    Memory usage per column in bytes (deep, including string objects),
+    largest first.
+    """
+    usage = df.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({
+        'dtype': df.dtypes.astype(str),
+        'bytes': usage,
+    })
+    report['share'] = report['bytes'] / max(report['bytes'].sum(), 1)
+    return report.sort_values('bytes', ascending=False)
@@ -0,0 +1,261 @@
+# Trigram index over the sample stems for the regex search box.
+# The literal parts a pattern requires are looked up in the index first, so
+# the regex itself only runs on the few stems that can match at all.
+
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# rows per block when building the index
+BUILD_CHUNK = 50000
+
+# number of pattern -> rows results kept
+LRU_SIZE = 64
+# total bytes of the kept results
+LRU_BYTES = 16 * 1024 * 1024
+
+_META = set('.^$*+?{}[]\\|()')
+
+
+def is_literal(pattern):
+    """
+    True if the pattern contains no regex syntax at all.
+    """
+    return not any(c in _META for c in pattern)
+
+
+def required_literals(pattern):
+    """
+    Literal substrings every match of pattern must contain.
+
+    The scan is conservative: whenever a construct is not understood
+    (alternation, lookarounds, quantified groups, ...) fewer or no
+    literals are returned, never wrong ones.
+    """
+    if '|' in pattern or '(?' in pattern:
+        return []
+    if re.search(r'\)[*?{]', pattern):
+        return []
+
+    runs = []
+    current = []
+
+    def flush():
+        if current:
+            runs.append(''.join(current))
+            current.clear()
+
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '\\':
+            nxt = pattern[i + 1:i + 2]
+            if nxt and not nxt.isalnum():
+                # escaped punctuation is a literal character
+                current.append(nxt)
+                i += 2
+                continue
+            flush()
+            i += 2
+            # skip the arguments of numeric escapes
+            if nxt in ('x', 'u', 'U'):
+                i += {'x': 2, 'u': 4, 'U': 8}[nxt]
+            elif nxt == 'N':
+                end = pattern.find('}', i)
+                i = n if end < 0 else end + 1
+            elif nxt.isdigit():
+                while i < n and pattern[i].isdigit():
+                    i += 1
+        elif c == '[':
+            flush()
+            i += 1
+            if i < n and pattern[i] == '^':
+                i += 1
+            if i < n and pattern[i] == ']':
+                i += 1
+            while i < n and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+            i += 1
+        elif c in '*?{':
+            # the previous character may occur zero times
+            if current:
+                current.pop()
+            flush()
+            if c == '{':
+                end = pattern.find('}', i)
+                i = n if end < 0 else end + 1
+            else:
+                i += 1
+        elif c in '+.^$()':
+            flush()
+            i += 1
+        else:
+            current.append(c)
+            i += 1
+    flush()
+    return [run.lower() for run in runs]
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _trigram_code(trigram):
+    a, b, c = (ord(ch) for ch in trigram)
+    return (a << 42) | (b << 21) | c
+
+
+class StemIndex:
+    """
+    Trigram postings over the lower-cased stems plus an LRU cache of
+    recent pattern results (int32 row positions), bounded by LRU_SIZE
+    entries and LRU_BYTES in total.
+
+    Postings are stored as one sorted array of trigram codes (three
+    21-bit code points) with offsets into a flat array of row positions.
+    search() may be called from several threads.
+    """
+
+    def __init__(self, stems):
+        values = np.asarray(stems, dtype=object)
+        self.valid = np.array([isinstance(s, str) for s in values])
+        self.stems = np.where(self.valid, values, '')
+        self.lower = np.array([s.lower() for s in self.stems], dtype=object)
+        self.all_rows = np.flatnonzero(self.valid).astype(np.int32)
+
+        self.keys, self.offsets, self.postings = self._build(self.lower)
+
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._last_literal = None
+        self._last_rows = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _build(lower):
+        keys_parts = []
+        rows_parts = []
+        for start in range(0, len(lower), BUILD_CHUNK):
+            block = np.array(lower[start:start + BUILD_CHUNK], dtype=str)
+            width = block.dtype.itemsize // 4
+            if width < 3:
+                continue
+            chars = block.view(np.uint32).reshape(len(block), width)
+            chars = chars.astype(np.uint64)
+            codes = (
+                (chars[:, :-2] << 42) | (chars[:, 1:-1] << 21) |
+                chars[:, 2:]
+            )
+            # trigrams reaching into the NUL padding do not exist
+            present = chars[:, 2:] != 0
+            rows, _ = np.nonzero(present)
+            codes = codes[present]
+
+            # one posting per (trigram, row)
+            order = np.lexsort((rows, codes))
+            codes = codes[order]
+            rows = rows[order]
+            keep = np.ones(len(codes), dtype=bool)
+            keep[1:] = (codes[1:] != codes[:-1]) | (rows[1:] != rows[:-1])
+            keys_parts.append(codes[keep])
+            rows_parts.append(rows[keep] + start)
+
+        if not keys_parts:
+            return (np.empty(0, np.uint64), np.zeros(1, np.int64),
+                    np.empty(0, np.int32))
+
+        codes = np.concatenate(keys_parts)
+        rows = np.concatenate(rows_parts)
+        # stable, so rows stay ascending within each trigram
+        order = np.argsort(codes, kind='stable')
+        codes = codes[order]
+        postings = rows[order].astype(np.int32)
+
+        keys, starts = np.unique(codes, return_index=True)
+        offsets = np.append(starts, len(codes)).astype(np.int64)
+        return keys, offsets, postings
+
+    def _posting(self, trigram):
+        code = np.uint64(_trigram_code(trigram))
+        pos = np.searchsorted(self.keys, code)
+        if pos == len(self.keys) or self.keys[pos] != code:
+            return np.empty(0, dtype=np.int32)
+        return self.postings[self.offsets[pos]:self.offsets[pos + 1]]
+
+    def candidates(self, pattern):
+        """
+        Sorted row positions that may match pattern, or None if the
+        index cannot narrow it down.
+        """
+        trigrams = set()
+        for literal in required_literals(pattern):
+            trigrams |= _trigrams(literal)
+        if not trigrams:
+            return None
+
+        postings = sorted(
+            (self._posting(t) for t in trigrams), key=len
+        )
+        rows = postings[0]
+        for other in postings[1:]:
+            if len(rows) == 0:
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+    def search(self, pattern):
+        """
+        Sorted row positions of all stems matching pattern
+        (case-insensitive regex search). Raises re.error for invalid
+        patterns.
+        """
+        regex = re.compile(pattern, re.IGNORECASE)
+
+        # the cache and the last literal result are shared state
+        with self._lock:
+            if pattern in self._cache:
+                self._cache.move_to_end(pattern)
+                rows = self._cache[pattern]
+            else:
+                rows = self._search(pattern, regex)
+                self._cache[pattern] = rows
+                self._cache_bytes += rows.nbytes
+                while len(self._cache) > LRU_SIZE or \
+                        self._cache_bytes > LRU_BYTES:
+                    _, old = self._cache.popitem(last=False)
+                    self._cache_bytes -= old.nbytes
+
+            if is_literal(pattern):
+                self._last_literal = pattern.lower()
+                self._last_rows = rows
+        return rows
+
+    def _search(self, pattern, regex):
+        if is_literal(pattern):
+            literal = pattern.lower()
+            if (self._last_literal is not None and
+                    self._last_literal in literal):
+                # the new pattern extends the previous one, so it can
+                # only match a subset of the previous result
+                candidates = self._last_rows
+            else:
+                candidates = self.candidates(pattern)
+                if candidates is None:
+                    candidates = self.all_rows
+            lower = self.lower
+            return np.array(
+                [i for i in candidates if literal in lower[i]],
+                dtype=np.int32
+            )
+
+        candidates = self.candidates(pattern)
+        if candidates is None:
+            candidates = self.all_rows
+        stems = self.stems
+        return np.array(
+            [i for i in candidates if regex.search(stems[i])],
+            dtype=np.int32
+        )
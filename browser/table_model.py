@@ -1,10 +1,74 @@
-from PySide6.QtCore import Qt, QAbstractTableModel
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+# rows handed to the view per fetchMore()
+FETCH_BATCH = 5000
+
+# formatted cell texts kept per column
+FORMAT_CACHE_SIZE = 50000
+
+# above this many inserted/removed row ranges a view update falls back
+# to a model reset
+MAX_DIFF_RANGES = 200
+
+
+def _ranges(positions):
+    """
+    Split sorted positions into contiguous (first, last) ranges.
+    """
+    if len(positions) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(positions) != 1)
+    firsts = positions[np.r_[0, breaks + 1]]
+    lasts = positions[np.r_[breaks, len(positions) - 1]]
+    return list(zip(firsts.tolist(), lasts.tolist()))
 
 
 class PandasTableModel(QAbstractTableModel):
-    def __init__(self, df, columns=None, ignore_columns=None, parent=None):
+    """
+    Table model showing a view of a DataFrame without copying it.
+
+    The view is an array of row positions into df plus optional derived
+    columns (e.g. 'distance'), given as full-length arrays aligned with
+    df. Sorting and filtering only replace the row array. source(name)
+    returns the full-length values of a column (default: from df), for
+    columns that are loaded after the model is created.
+
+    Column values are read from per-column NumPy arrays, cell texts are
+    formatted on demand and kept in a bounded per-column cache keyed by
+    the original index. Rows are handed to the view in batches through
+    canFetchMore()/fetchMore().
+
+    Sorting uses a cached argsort permutation of the whole column: the
+    view rows are picked out of it in order, flipping the direction is
+    a reversal. The rows keep their original indices.
+
+    A new view is diffed against the current one and applied as
+    rowsRemoved/rowsInserted, so selection and scroll position survive
+    filter changes. Reorderings of the same rows go through one layout
+    change that moves the persistent indices along. A new view that is
+    too fragmented to diff (more than MAX_DIFF_RANGES ranges, e.g. a
+    broad regex) resets the model instead: one signal rather than
+    thousands, at the price of the selection and scroll position.
+    """
+
+    def __init__(self, df, columns=None, ignore_columns=None, parent=None,
+                 rows=None, extra=None, source=None):
         super().__init__(parent)
         self.df = df
+        self.source = source or (lambda name: df[name].to_numpy())
+        self.rows = np.arange(len(df)) if rows is None else rows
+        self.extra = extra or {}
+        self._arrays = {}
+        self._texts = {}
+        self._orders = {}
+        self._positions = None
+        self._positions_of = None
+        self._fetched = min(FETCH_BATCH, len(self.rows))
+        self._fetching = False
         if columns:
             self.columns = columns
         else:
@@ -16,11 +80,103 @@ class PandasTableModel(QAbstractTableModel):
             ]
 
     def rowCount(self, parent=None):
-        return len(self.df)
+        return self._fetched
+
+    def total_rows(self):
+        """
+        Number of rows in the view, including rows not fetched yet.
+        """
+        return len(self.rows)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return self._fetched < len(self.rows)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        self.fetch_to(self._fetched + FETCH_BATCH - 1)
+
+    def fetch_to(self, row):
+        """
+        Make sure the view row is fetched (e.g. before selecting it).
+        """
+        new_count = min(row + 1, len(self.rows))
+        # views call fetchMore() while they handle an insertion or reset
+        if new_count <= self._fetched or self._fetching:
+            return
+        self._fetching = True
+        self.beginInsertRows(QModelIndex(), self._fetched, new_count - 1)
+        self._fetched = new_count
+        self.endInsertRows()
+        self._fetching = False
 
     def columnCount(self, parent=None):
         return len(self.columns)
 
+    def column_values(self, col_name):
+        """
+        Full-length values of a base or derived column.
+        """
+        if col_name in self.extra:
+            return self.extra[col_name]
+        values = self._arrays.get(col_name)
+        if values is None:
+            values = self.source(col_name)
+            self._arrays[col_name] = values
+        return values
+
+    def value(self, row, col_name):
+        """
+        Value at view row for any column of the base frame, shown or not.
+        """
+        return self.column_values(col_name)[self.rows[row]]
+
+    def text(self, row, col_name):
+        """
+        Formatted cell text, cached per column and original index.
+        """
+        idx = int(self.rows[row])
+        cache = self._texts.setdefault(col_name, {})
+        text = cache.get(idx)
+        if text is None:
+            text = str(self.column_values(col_name)[idx])
+            if len(cache) >= FORMAT_CACHE_SIZE:
+                # drop the older half of the entries
+                for key in list(islice(cache, FORMAT_CACHE_SIZE // 2)):
+                    del cache[key]
+            cache[idx] = text
+        return text
+
+    def row_index(self, row):
+        """
+        Original index (row position in df) of a view row.
+        """
+        return self.rows[row]
+
+    def _view_positions(self):
+        """
+        View row of every original index (-1 if not shown). Rebuilt once
+        after the rows have changed, the row array is never modified in
+        place.
+        """
+        if self._positions_of is not self.rows:
+            positions = np.full(len(self.df), -1, dtype=np.int64)
+            positions[self.rows] = np.arange(len(self.rows))
+            self._positions = positions
+            self._positions_of = self.rows
+        return self._positions
+
+    def view_row(self, original_idx):
+        """
+        View row of an original index, or None if it is not shown.
+        """
+        if original_idx is None:
+            return None
+        row = self._view_positions()[original_idx]
+        return int(row) if row >= 0 else None
+
     def data(self, index, role=Qt.DisplayRole):
         if not index.isValid():
             return None
@@ -28,8 +184,7 @@ class PandasTableModel(QAbstractTableModel):
         if role == Qt.DisplayRole:
             row = index.row()
             col = index.column()
-            col_name = self.columns[col]
-            return str(self.df.iloc[row][col_name])
+            return self.text(row, self.columns[col])
 
         return None
 
@@ -41,21 +196,197 @@ class PandasTableModel(QAbstractTableModel):
                 return str(section)
         return None
 
-    def update_data(self, new_df):
+    def update_view(self, rows, extra=None):
+        """
+        Show new row positions (and derived columns) of the base frame.
+        """
+        changed = []
+        if extra is not None:
+            # texts of replaced derived columns are stale
+            for name, values in extra.items():
+                if self.extra.get(name) is not values:
+                    self._texts.pop(name, None)
+                    self._orders.pop(name, None)
+                    changed.append(name)
+            self.extra = extra
+
+        if not self._apply_diff(rows):
+            if len(rows) == len(self.rows) and np.array_equal(
+                    np.sort(rows), np.sort(self.rows)):
+                self._relayout(rows)
+            else:
+                self._reset(rows)
+
+        # refill the first batch if rows were removed from it
+        self.fetch_to(min(FETCH_BATCH, len(self.rows)) - 1)
+
+        if self._fetched:
+            for name in changed:
+                if name in self.columns:
+                    col = self.columns.index(name)
+                    self.dataChanged.emit(
+                        self.index(0, col),
+                        self.index(self._fetched - 1, col)
+                    )
+
+    def _apply_diff(self, rows):
+        """
+        Apply a new view as row removals and insertions. Returns False
+        if the rows in both views are ordered differently or the diff is
+        too fragmented.
+        """
+        old = self.rows
+        if len(old) == len(rows) and np.array_equal(old, rows):
+            self.rows = rows
+            return True
+
+        keep_old = np.isin(old, rows, assume_unique=True)
+        keep_new = np.isin(rows, old, assume_unique=True)
+        if not np.array_equal(old[keep_old], rows[keep_new]):
+            return False
+
+        removed = _ranges(np.flatnonzero(~keep_old))
+        inserted = _ranges(np.flatnonzero(~keep_new))
+        if len(removed) + len(inserted) > MAX_DIFF_RANGES:
+            return False
+
+        # bottom up, so the positions of earlier ranges stay valid
+        for first, last in reversed(removed):
+            if first < self._fetched:
+                shown = min(last, self._fetched - 1)
+                self.beginRemoveRows(QModelIndex(), first, shown)
+                self.rows = np.delete(self.rows, np.s_[first:last + 1])
+                self._fetched -= shown - first + 1
+                self.endRemoveRows()
+            else:
+                self.rows = np.delete(self.rows, np.s_[first:last + 1])
+
+        # top down, positions are already final in the new view
+        for first, last in inserted:
+            block = rows[first:last + 1]
+            if first < self._fetched:
+                self.beginInsertRows(QModelIndex(), first, last)
+                self.rows = np.insert(self.rows, first, block)
+                self._fetched += len(block)
+                self.endInsertRows()
+            else:
+                self.rows = np.insert(self.rows, first, block)
+
+        self.rows = rows
+        return True
+
+    def _relayout(self, rows):
+        """
+        Show the same rows in a new order in one layout change, moving
+        persistent indices (selection, current index) to the new
+        positions of their rows. The rows they move to are fetched
+        before the layout change, the row count never changes inside it.
+        """
+        persistent = self.persistentIndexList()
+        if persistent:
+            positions = np.full(len(self.df), -1, dtype=np.int64)
+            positions[rows] = np.arange(len(rows))
+            new_rows = positions[self.rows[[i.row() for i in persistent]]]
+            self.fetch_to(int(new_rows.max()))
+        self.fetch_to(min(FETCH_BATCH, len(rows)) - 1)
+
         self.layoutAboutToBeChanged.emit()
-        self.df = new_df.reset_index(drop=True)  # still full
+        old = self.rows
+        # the views may have added persistent indices for the change
+        persistent = self.persistentIndexList()
+        self.rows = rows
+        if persistent:
+            positions = self._view_positions()
+            new_rows = positions[old[[index.row() for index in persistent]]]
+            moved = [
+                self.index(int(pos), index.column())
+                if 0 <= pos < self._fetched else QModelIndex()
+                for index, pos in zip(persistent, new_rows)
+            ]
+            self.changePersistentIndexList(persistent, moved)
         self.layoutChanged.emit()
 
+    def _reset(self, rows):
+        """
+        Replace the view with a model reset. Selection and scroll
+        position are lost, but a reset is a single signal however
+        fragmented the change is.
+        """
+        self._fetching = True
+        self.beginResetModel()
+        self.rows = rows
+        self._fetched = min(FETCH_BATCH, len(rows))
+        self.endResetModel()
+        self._fetching = False
+
     def set_columns(self, columns):
         self.beginResetModel()
         self.columns = columns
-        self.df = self.df_all[self.columns]
         self.endResetModel()
 
+    def _order(self, col_name):
+        """
+        Cached (ascending argsort of the full column with missing values
+        last, number of non-missing values, dense rank per row, number of
+        distinct ranks). Missing values get the rank after the last one.
+        """
+        if col_name not in self._orders:
+            values = self.column_values(col_name)
+            series = pd.Series(values)
+            order = series.sort_values(
+                kind='stable', na_position='last'
+            ).index.to_numpy()
+            missing = series.isna().to_numpy()
+            n_valid = len(order) - int(missing.sum())
+
+            # equal values share a rank, so later keys can break the tie
+            sorted_values = values[order[:n_valid]]
+            dense = np.zeros(len(order), dtype=np.int64)
+            if n_valid > 1:
+                dense[1:n_valid] = np.cumsum(
+                    sorted_values[1:] != sorted_values[:-1]
+                )
+            n_ranks = dense[n_valid - 1] + 1 if n_valid else 0
+            dense[n_valid:] = n_ranks
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = dense
+
+            self._orders[col_name] = (order, n_valid, rank, n_ranks)
+        return self._orders[col_name]
+
+    def _sorted_rows(self, col_name, ascending):
+        order, n_valid, _, _ = self._order(col_name)
+        if not ascending:
+            # reverse the valid part, missing values stay last
+            order = np.concatenate([order[:n_valid][::-1], order[n_valid:]])
+        if len(self.rows) == len(order):
+            return order
+
+        in_view = np.zeros(len(order), dtype=bool)
+        in_view[self.rows] = True
+        return order[in_view[order]]
+
+    def _rank(self, col_name, ascending):
+        _, _, rank, n_ranks = self._order(col_name)
+        if ascending:
+            return rank
+        # missing values (rank n_ranks) stay last
+        return np.where(rank < n_ranks, n_ranks - 1 - rank, rank)
+
     def sort(self, column, order=Qt.AscendingOrder):
-        col_name = self.columns[column]
-        self.layoutAboutToBeChanged.emit()
-        ascending = order == Qt.AscendingOrder
-        self.df = self.df.sort_values(col_name, ascending=ascending)
-        self.df.reset_index(drop=True, inplace=True)
-        self.layoutChanged.emit()
+        self.sort_by([(self.columns[column], order == Qt.AscendingOrder)])
+
+    def sort_by(self, keys):
+        """
+        Stable sort by several columns. keys is a list of
+        (column name, ascending) pairs, the first one is the primary key.
+        """
+        if len(keys) == 1:
+            rows = self._sorted_rows(*keys[0])
+        else:
+            ranks = [
+                self._rank(name, ascending)[self.rows]
+                for name, ascending in reversed(keys)
+            ]
+            rows = self.rows[np.lexsort(ranks)]
+        self._relayout(rows)
@@ -0,0 +1,190 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pyqtgraph as pg
+from PySide6.QtCore import QObject, Signal
+
+from browser.peaks import build_peaks
+
+# bins drawn per pixel of the view width
+BINS_PER_PIXEL = 2
+
+
+class PeakBuilder(QObject):
+    """
+    Builds peak sidecars (see browser.peaks) in a process pool.
+
+    request(paths) queues the files that have no peaks yet and cancels
+    queued files of earlier requests that are not in paths. ready(path)
+    is emitted on the GUI thread when the peaks of a file are built.
+    The pool is started with the first request and started again if a
+    worker died. Failures are printed, request() never raises.
+    """
+
+    ready = Signal(str)
+    # pool thread -> GUI thread, (path, future, pool number)
+    _finished = Signal(str, object, int)
+
+    def __init__(self, cache, workers=None, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.workers = workers or max((os.cpu_count() or 2) - 1, 1)
+        self._executor = None
+        # counts the pools started, failures of an old pool are ignored
+        self._pool = 0
+        self._futures = {}
+        self._finished.connect(self._done)
+
+    def request(self, paths):
+        paths = list(dict.fromkeys(paths))
+        for path, future in list(self._futures.items()):
+            if path not in paths:
+                # a cancelled future is dropped by _done()
+                future.cancel()
+        for path in paths:
+            if path in self._futures or path in self.cache:
+                continue
+            future = self._submit(path)
+            if future is None:
+                continue
+            self._futures[path] = future
+            future.add_done_callback(
+                lambda future, path=path, pool=self._pool:
+                    self._finished.emit(path, future, pool)
+            )
+
+    def _submit(self, path):
+        """
+        Queue one file, with a new pool if the current one is broken.
+        None if the file could not be queued.
+        """
+        for _ in range(2):
+            if self._executor is None:
+                try:
+                    # spawn, forking a process with Qt threads is not safe
+                    self._executor = ProcessPoolExecutor(
+                        self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                    self._pool += 1
+                except Exception as e:
+                    print(f"Could not start the peak builder: {e}")
+                    return None
+            try:
+                return self._executor.submit(
+                    build_peaks, path, self.cache.cache_dir
+                )
+            except RuntimeError:
+                # BrokenProcessPool: a worker died, the files queued in
+                # the old pool fail with it
+                self._drop_pool()
+        print(f"Could not queue peaks of {path}")
+        return None
+
+    def _drop_pool(self):
+        try:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        except Exception as e:
+            print(f"Could not shut down the peak builder: {e}")
+        self._executor = None
+
+    def _done(self, path, future, pool):
+        if self._futures.get(path) is future:
+            del self._futures[path]
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            print(f"Could not build peaks of {path}: {error}")
+            if isinstance(error, BrokenProcessPool) and \
+                    pool == self._pool and self._executor is not None:
+                # the next request starts a new pool
+                self._drop_pool()
+            return
+        self.ready.emit(path)
+
+
+class WaveformView(pg.PlotWidget):
+    """
+    Waveform of one sample, min/max and RMS per bin from its Peaks.
+
+    Whenever the visible range changes, the level with about
+    BINS_PER_PIXEL bins per pixel is sliced from the memory-mapped
+    peaks, so zooming never reads the audio. The LinearRegionItem marks
+    the played region, region_changed(start, end) is emitted when it is
+    dragged.
+    """
+
+    region_changed = Signal(float, float)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.peaks = None
+        self.setMenuEnabled(False)
+        self.setMouseEnabled(x=True, y=False)
+        self.hideAxis('left')
+        self.setYRange(-1, 1, padding=0.05)
+
+        self.envelope = pg.PlotCurveItem(
+            pen=pg.mkPen((100, 150, 255)), connect='pairs'
+        )
+        self.rms = pg.PlotCurveItem(
+            pen=pg.mkPen((180, 210, 255)), connect='pairs'
+        )
+        self.addItem(self.envelope)
+        self.addItem(self.rms)
+
+        self.region = pg.LinearRegionItem()
+        self.region.hide()
+        self.addItem(self.region, ignoreBounds=True)
+        self.region.sigRegionChangeFinished.connect(self._region_moved)
+
+        self.getViewBox().sigXRangeChanged.connect(self._redraw)
+
+    def set_peaks(self, peaks):
+        """
+        Show the waveform of peaks (None clears the view).
+        """
+        self.peaks = peaks
+        if peaks is None:
+            self.envelope.setData([], [])
+            self.rms.setData([], [])
+            self.region.hide()
+            return
+        duration = max(peaks.duration, 1e-3)
+        self.setLimits(xMin=0, xMax=duration)
+        self.region.setBounds((0, duration))
+        self.region.show()
+        self.setXRange(0, duration, padding=0)
+        self._redraw()
+
+    def set_region(self, start, end):
+        """
+        Mark start..end seconds, an end of None or 0 is the file end.
+        """
+        if self.peaks is None:
+            return
+        self.region.blockSignals(True)
+        self.region.setRegion((start, end or self.peaks.duration))
+        self.region.blockSignals(False)
+
+    def _region_moved(self):
+        start, end = self.region.getRegion()
+        self.region_changed.emit(start, end)
+
+    def _redraw(self, *args):
+        if self.peaks is None:
+            return
+        x_min, x_max = self.getViewBox().viewRange()[0]
+        times, rows = self.peaks.envelope(
+            x_min, x_max, max(self.width(), 1) * BINS_PER_PIXEL
+        )
+        # a vertical line per bin
+        x = np.repeat(times, 2)
+        self.envelope.setData(x, rows[:, :2].ravel())
+        self.rms.setData(
+            x, np.column_stack((-rows[:, 2], rows[:, 2])).ravel()
+        )
@@ -1,19 +1,31 @@
 import sys
 import os
 import numpy as np
-import ast
 
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
     QLineEdit, QTableView, QLabel, QComboBox,
-    QPushButton, QCheckBox, QListWidget, QFileDialog
+    QPushButton, QCheckBox, QListWidget, QFileDialog, QProgressBar,
+    QDoubleSpinBox
 )
 from PySide6.QtCore import Qt
 import pyqtgraph as pg
 
 from browser.audioplayer import AudioPlayer
-from browser.data_model import SampleDataModel
+from browser.loader import DataLoader
+from browser.peaks import PeakCache, peaks_dir_for
+from browser.query import FilterQuery, SimilarityQuery
+from browser.row_index import RowIndex
+from browser.scatter_layer import PointsItem, ScatterLayer
 from browser.table_model import PandasTableModel
+from browser.waveform import PeakBuilder, WaveformView
+
+# how far from a scatter point a click still selects it
+CLICK_RADIUS_PX = 6
+# table rows around the selection decoded before they are played
+PREFETCH_NEIGHBOURS = 2
+# best matches of the similarity list decoded before they are played
+PREFETCH_TOP = 5
 
 
 class MainWindow(QWidget):
@@ -26,22 +38,13 @@ class MainWindow(QWidget):
     def __init__(self, csv_path):
         """
         Initialize the main window and all UI elements.
+        The data is loaded on a worker thread, widgets are enabled once
+        their data is ready.
         If the CSV file or Samples folder is not found, prompt the user.
         """
         super().__init__()
         self.setWindowTitle("Sample Browser")
 
-        # === Load Data ===
-        try:
-            self.data_model = SampleDataModel(csv_path)
-        except FileNotFoundError:
-            print("Samples data CSV not found, please select manually.")
-            csv_path = self.select_csv_file()
-            if not csv_path:
-                print("No file selected. Exiting.")
-                sys.exit(1)
-            self.data_model = SampleDataModel(csv_path)
-
         # === Check Samples folder ===
         self.folderpath = os.path.join(
             os.path.dirname(os.path.abspath(__file__)), 'Samples'
@@ -56,47 +59,173 @@ class MainWindow(QWidget):
         self.audio_player = AudioPlayer()
         self.selected_file = None
         self.sample_path = None
+        self.sample_missing = False
 
         self.last_sorted_column = -1
         self.last_sort_order = Qt.AscendingOrder
 
-        # === Initialize main table model ===
-        self.table_model = PandasTableModel(
-            self.data_model.df_filtered,
-            columns=['stem', 'duration', 'channels',
-                     'tonality', 'tempo', 'bit_depth']
-        )
-
-        # === Feature list for similarity ===
-        numeric_cols = self.get_numeric_columns()
-        self.feature_list = QListWidget()
-        self.feature_list.setSelectionMode(QListWidget.MultiSelection)
-        self.feature_list.addItems(numeric_cols)
+        # === Models are created once the data is loaded ===
+        self.data_model = None
+        self.table_model = None
+        self.sorted_table_model = None
 
         # === Layout ===
         self.layout = QVBoxLayout()
         self.setLayout(self.layout)
 
+        self.init_load_progress()
         self.init_player_controls()
+        self.init_waveform_view()
         self.init_regex_filter_controls()
         self.init_table_view()
-        self.init_feature_selection(numeric_cols)
+        self.init_feature_selection()
         self.init_scatter_plot()
-        self.init_similarity_output(numeric_cols)
+        self.init_similarity_output()
+        self.set_data_widgets_enabled(False)
+        self.set_similarity_widgets_enabled(False)
+
+        # === Load Data ===
+        self.start_loading(csv_path)
+
+    def start_loading(self, csv_path):
+        """
+        Load the samples data on a worker thread.
+        """
+        self.loader = DataLoader(csv_path, self.folderpath, self)
+        self.loader.progress.connect(self.on_load_progress)
+        self.loader.loaded.connect(self.on_data_loaded)
+        self.loader.failed.connect(self.on_load_failed)
+        self.loader.start()
+
+    def on_load_progress(self, stage, done, total):
+        """
+        Show loading progress of the data model.
+        """
+        texts = {
+            'parse': f"Parsing CSV: {done} / ~{total} rows",
+            'types': f"Typing columns: {done} / {total}",
+            'paths': "Checking sample files...",
+            'columns': f"Loading features: {done} / {total} columns",
+            'features': "Building feature matrix...",
+        }
+        self.progress_label.setText(texts.get(stage, stage))
+        self.progress_bar.setMaximum(max(total, 1))
+        self.progress_bar.setValue(done)
+
+        if stage == 'paths' and done == total and self.table_model:
+            self.update_missing_files()
+
+        if stage == 'features' and done == total:
+            self.progress_label.hide()
+            self.progress_bar.hide()
+            if self.data_model is not None:
+                self.set_similarity_widgets_enabled(True)
+
+    def on_load_failed(self, error):
+        """
+        Ask for the CSV if it was not found, otherwise quit.
+        """
+        if isinstance(error, FileNotFoundError):
+            print("Samples data CSV not found, please select manually.")
+            csv_path = self.select_csv_file()
+            if csv_path:
+                self.start_loading(csv_path)
+                return
+            print("No file selected. Exiting.")
+        else:
+            print(f"Could not load samples data: {error}")
+        QApplication.exit(1)
+
+    def on_data_loaded(self, data_model):
+        """
+        Create the models, fill the widgets and enable them.
+        """
+        self.data_model = data_model
+        numeric_cols = self.get_numeric_columns()
+
+        # === Initialize main table model ===
+        self.table_model = PandasTableModel(
+            self.data_model.df_all,
+            columns=['stem', 'duration', 'channels',
+                     'tonality', 'tempo', 'bit_depth'],
+            rows=self.data_model.rows,
+            extra=self.data_model.derived_columns(),
+            source=self.data_model.column
+        )
+        self.table_view.setModel(self.table_model)
+        header = self.table_view.horizontalHeader()
+        header.resizeSection(0, 150)  # stem
+        header.resizeSection(1, 150)  # duration
+
+        # === Sorted output list ===
+        self.sorted_table_model = PandasTableModel(
+            self.data_model.df_all, columns=['stem', 'distance'],
+            rows=self.data_model.rows,
+            extra=self.data_model.derived_columns(),
+            source=self.data_model.column
+        )
+        self.sorted_table_view.setModel(self.sorted_table_model)
+        header = self.sorted_table_view.horizontalHeader()
+        header.resizeSection(0, 200)
+        header.resizeSection(1, 200)
+
+        self.scatter_layer = ScatterLayer(
+            self.scatter, self.density, self.data_model
+        )
+        self.filter_query = FilterQuery(self.data_model, parent=self)
+        self.similarity_query = SimilarityQuery(self.data_model, parent=self)
+        self.peak_cache = PeakCache(peaks_dir_for(self.data_model.csv_path))
+        self.peak_builder = PeakBuilder(self.peak_cache, parent=self)
+        self.row_index = RowIndex(
+            self.data_model.stem_rows, self.table_model,
+            self.sorted_table_model, self.scatter_layer
+        )
+
+        # === Feature lists ===
+        self.populate_feature_selection(numeric_cols)
+        self.feature_list.addItems(numeric_cols)
+
         self.init_signals()
 
         # === Initial updates ===
         self.update_info_label()
         self.update_plot()
 
+        self.set_data_widgets_enabled(True)
+        if self.data_model.features_ready.is_set():
+            self.set_similarity_widgets_enabled(True)
+
+    def set_data_widgets_enabled(self, enabled):
+        """
+        Enable the widgets that need the sample table.
+        """
+        for widget in (
+            self.play_btn, self.stop_btn, self.loop_check,
+            self.start_spin, self.end_spin, self.waveform,
+            self.regex_input, self.random_button,
+            self.show_all_cols_checkbox, self.table_view,
+            self.x_combo, self.y_combo, self.color_combo,
+            self.color_feature_checkbox, self.plot_widget,
+            self.hide_missing_checkbox
+        ):
+            widget.setEnabled(enabled)
+
+    def set_similarity_widgets_enabled(self, enabled):
+        """
+        Enable the widgets that need the feature matrix.
+        """
+        for widget in (
+            self.calc_dist_btn, self.master_checkbox,
+            self.similarity_combo, self.feature_list,
+            self.show_color_checkbox, self.sorted_table_view
+        ):
+            widget.setEnabled(enabled)
+
     def get_numeric_columns(self):
         """
         Return numeric columns excluding unwanted ones.
         """
-        numeric_cols = self.data_model.df_filtered.select_dtypes(
-            include=[np.number]
-        ).columns.tolist()
-        return [col for col in numeric_cols if col not in ['idx', 'distance']]
+        return list(self.data_model.feature_columns)
 
     def select_csv_file(self):
         """
@@ -122,24 +251,60 @@ class MainWindow(QWidget):
             self, "Select Samples Folder", options=options
         )
 
+    def init_load_progress(self):
+        """
+        Initialize progress bar and label shown while loading.
+        """
+        progress_layout = QHBoxLayout()
+        self.progress_label = QLabel("Loading samples data...")
+        self.progress_bar = QProgressBar()
+        progress_layout.addWidget(self.progress_label)
+        progress_layout.addWidget(self.progress_bar)
+        self.layout.addLayout(progress_layout)
+
     def init_player_controls(self):
         """
-        Initialize audio player buttons and loop checkbox.
+        Initialize audio player buttons, loop checkbox and the
+        start/end of the played region.
         """
         self.play_btn = QPushButton("Play")
         self.stop_btn = QPushButton("Stop")
         self.loop_check = QCheckBox("Loop")
 
+        # region in seconds, an end of 0 plays to the end of the file
+        self.start_spin = QDoubleSpinBox()
+        self.start_spin.setPrefix("Start: ")
+        self.start_spin.setSuffix(" s")
+        self.end_spin = QDoubleSpinBox()
+        self.end_spin.setPrefix("End: ")
+        self.end_spin.setSuffix(" s")
+        self.end_spin.setSpecialValueText("End: file end")
+        for spin in (self.start_spin, self.end_spin):
+            spin.setDecimals(2)
+            spin.setSingleStep(0.1)
+            spin.setMaximum(3600)
+
         player_layout = QHBoxLayout()
         player_layout.addWidget(self.play_btn)
         player_layout.addWidget(self.stop_btn)
         player_layout.addWidget(self.loop_check)
+        player_layout.addWidget(self.start_spin)
+        player_layout.addWidget(self.end_spin)
         self.layout.addLayout(player_layout)
 
+    def init_waveform_view(self):
+        """
+        Initialize the waveform of the selected sample, its region is
+        the start/end of the player.
+        """
+        self.waveform = WaveformView()
+        self.waveform.setFixedHeight(120)
+        self.layout.addWidget(self.waveform)
+
     def init_regex_filter_controls(self):
         """
         Initialize search box, info label, random sample button,
-        and show-all checkbox.
+        show-all and hide-missing checkboxes.
         """
         regex_layout = QHBoxLayout()
         self.regex_input = QLineEdit()
@@ -155,6 +320,9 @@ class MainWindow(QWidget):
         self.show_all_cols_checkbox = QCheckBox("Show all Features")
         regex_layout.addWidget(self.show_all_cols_checkbox)
 
+        self.hide_missing_checkbox = QCheckBox("Hide missing files")
+        regex_layout.addWidget(self.hide_missing_checkbox)
+
         self.layout.addLayout(regex_layout)
 
     def init_table_view(self):
@@ -162,15 +330,10 @@ class MainWindow(QWidget):
         Initialize table view for displaying metadata.
         """
         self.table_view = QTableView()
-        self.table_view.setModel(self.table_model)
         self.table_view.setSortingEnabled(True)
         self.layout.addWidget(self.table_view)
 
-        header = self.table_view.horizontalHeader()
-        header.resizeSection(0, 150)  # stem
-        header.resizeSection(1, 150)  # duration
-
-    def init_feature_selection(self, numeric_cols):
+    def init_feature_selection(self):
         """
         Initialize scatter plot axis selectors and color feature selector.
         """
@@ -214,6 +377,10 @@ class MainWindow(QWidget):
 
         self.layout.addLayout(axis_layout)
 
+    def populate_feature_selection(self, numeric_cols):
+        """
+        Fill the axis and color selectors with the numeric features.
+        """
         # Populate combos
         scatter_cols = numeric_cols
         self.x_combo.addItems(scatter_cols)
@@ -236,15 +403,19 @@ class MainWindow(QWidget):
         self.plot_widget = pg.PlotWidget()
         self.layout.addWidget(self.plot_widget)
 
-        self.scatter = pg.ScatterPlotItem(size=8, pen=None)
+        self.scatter = PointsItem(size=8, pen=None)
         self.plot_widget.addItem(self.scatter)
 
+        # shown instead of the points when too many are visible
+        self.density = pg.ImageItem()
+        self.plot_widget.addItem(self.density, ignoreBounds=True)
+
         self.highlight = pg.ScatterPlotItem(
             size=15, pen=pg.mkPen('r', width=2)
         )
         self.plot_widget.addItem(self.highlight)
 
-    def init_similarity_output(self, numeric_cols):
+    def init_similarity_output(self):
         """
         Initialize similarity search UI: features, method, sorted results.
         """
@@ -259,6 +430,11 @@ class MainWindow(QWidget):
         self.calc_dist_btn = QPushButton("Similarity Search")
         left_layout.addWidget(self.calc_dist_btn)
 
+        # shown while a search runs on the worker thread
+        self.similarity_progress = QProgressBar()
+        self.similarity_progress.hide()
+        left_layout.addWidget(self.similarity_progress)
+
         select_method_layout = QHBoxLayout()
         self.master_checkbox = QCheckBox("Select all features")
         self.similarity_combo = QComboBox()
@@ -269,7 +445,6 @@ class MainWindow(QWidget):
 
         self.feature_list = QListWidget()
         self.feature_list.setSelectionMode(QListWidget.MultiSelection)
-        self.feature_list.addItems(numeric_cols)
         left_layout.addWidget(self.feature_list)
 
         # Right output
@@ -279,15 +454,8 @@ class MainWindow(QWidget):
         )
         right_layout.addWidget(self.show_color_checkbox)
 
-        self.sorted_table_model = PandasTableModel(
-            self.data_model.df_filtered, columns=['stem', 'distance']
-        )
         self.sorted_table_view = QTableView()
-        self.sorted_table_view.setModel(self.sorted_table_model)
         self.sorted_table_view.setSortingEnabled(True)
-        header = self.sorted_table_view.horizontalHeader()
-        header.resizeSection(0, 200)
-        header.resizeSection(1, 200)
         right_layout.addWidget(self.sorted_table_view)
 
         right_layout.addWidget(QLabel(
@@ -302,7 +470,9 @@ class MainWindow(QWidget):
         """
         Connect signals to their respective slots.
         """
-        self.regex_input.textChanged.connect(self.update_filter)
+        self.regex_input.textChanged.connect(self.submit_filter)
+        self.hide_missing_checkbox.stateChanged.connect(self.submit_filter)
+        self.filter_query.ready.connect(self.update_filter)
         self.show_all_cols_checkbox.stateChanged.connect(
             self.toggle_all_columns
         )
@@ -317,27 +487,49 @@ class MainWindow(QWidget):
         self.play_btn.clicked.connect(self.play_audio)
         self.stop_btn.clicked.connect(self.audio_player.stop)
         self.loop_check.stateChanged.connect(self.toggle_loop)
+        self.start_spin.valueChanged.connect(self.update_waveform_region)
+        self.end_spin.valueChanged.connect(self.update_waveform_region)
+        self.waveform.region_changed.connect(self.set_play_region)
+        self.peak_builder.ready.connect(self.on_peaks_ready)
 
         self.table_view.clicked.connect(self.table_row_clicked)
         self.table_view.horizontalHeader().sectionClicked.connect(
             self.handle_header_clicked
         )
 
-        self.scatter.sigClicked.connect(self.scatter_point_clicked)
+        self.plot_widget.scene().sigMouseClicked.connect(self.plot_clicked)
+        self.plot_widget.getViewBox().sigRangeChanged.connect(
+            self.plot_range_changed
+        )
 
         self.calc_dist_btn.clicked.connect(self.compute_similarity)
+        self.similarity_query.progress.connect(self.on_similarity_progress)
+        self.similarity_query.finished.connect(self.on_similarity_finished)
         self.master_checkbox.stateChanged.connect(self.toggle_all_features)
         self.sorted_table_view.horizontalHeader().sectionClicked.connect(
             self.handle_sorted_header_clicked
         )
         self.sorted_table_view.clicked.connect(self.sorted_table_row_clicked)
 
-    def update_filter(self, pattern):
+    def submit_filter(self):
         """
-        Filter samples based on regex input.
+        Queue the search box pattern for filter_query.
         """
-        filtered = self.data_model.filter_by_regex(pattern)
-        self.table_model.update_data(filtered)
+        self.filter_query.submit(
+            self.regex_input.text(), self.hide_missing_checkbox.isChecked()
+        )
+
+    def update_filter(self, rows):
+        """
+        Show the samples matching the regex input (matched by
+        filter_query on a worker thread).
+        """
+        # a running similarity search belongs to the old filter
+        self.cancel_similarity()
+        rows = self.data_model.set_filter(rows)
+        self.table_model.update_view(
+            rows, self.data_model.derived_columns()
+        )
         self.update_info_label()
         self.update_plot()
         self.update_sorted_table()
@@ -346,82 +538,99 @@ class MainWindow(QWidget):
         """
         Update info label with the number of matching files.
         """
-        n = len(self.data_model.df_filtered)
-        self.info_label.setText(f"{n} files found")
+        rows = self.data_model.rows
+        n = len(rows)
+        n_missing = int(self.data_model.file_missing[rows].sum())
+        if n_missing:
+            self.info_label.setText(
+                f"{n} files found ({n_missing} missing)"
+            )
+        else:
+            self.info_label.setText(f"{n} files found")
+
+    def update_missing_files(self):
+        """
+        Show the 'file_missing' column once the sample files are checked.
+        """
+        n_missing = self.data_model.path_index.n_missing()
+        if n_missing:
+            print(f"{n_missing} sample files not found "
+                  f"in {self.folderpath}")
+        extra = self.data_model.derived_columns()
+        self.table_model.update_view(self.table_model.rows, extra)
+        self.sorted_table_model.update_view(
+            self.sorted_table_model.rows, extra
+        )
+        self.update_info_label()
+        if self.hide_missing_checkbox.isChecked():
+            self.submit_filter()
 
     def select_random_sample(self):
         """
         Select a random sample from the filtered DataFrame.
         """
-        if self.data_model.df_filtered.empty:
+        if self.table_model.total_rows() == 0:
             print("No samples available!")
             return
 
-        # Select a random row index
-        random_index = np.random.choice(self.data_model.df_filtered.index)
-        row_pos = self.data_model.df_filtered.index.get_loc(random_index)
+        # Select a random row position
+        row_pos = np.random.randint(self.table_model.total_rows())
+        random_index = self.table_model.row_index(row_pos)
 
         # Select the sample by row position
         self.select_sample_by_row(row_pos)
 
-        # Highlight in table and scatter plot
-        self.table_view.selectRow(row_pos)
-        for s in self.scatter.points():
-            if s.data() == random_index:
-                self.highlight.setData([{'pos': s.pos()}])
-                break
-
-        # Select in sorted table
-        self.select_in_sorted_table(self.selected_file)
-
-        # Highlight the selected point in the scatter plot
-        self.highlight.setData([{'pos': self.scatter.points()[row_pos].pos()}])
+        # Highlight in tables and scatter plot
+        self.show_in_views(self.row_index.locate_index(random_index))
 
     def toggle_all_columns(self, state):
         """
         Schaltet zwischen allen Columns und den Standard-Spalten um.
         """
         if self.show_all_cols_checkbox.isChecked():
-            # all cols except 'idx', 'dir', 'distance'
+            # all cols except 'idx', 'dir_path', 'distance'
             all_cols = [
-                col for col in self.data_model.df_filtered.columns
-                if col not in ['idx', 'dir', 'distance']
+                col for col in self.data_model.all_columns
+                if col not in ['idx', 'dir_path', 'distance']
             ]
+            # load the feature columns on first use
+            self.data_model.ensure_columns(all_cols)
+            if 'file_missing' in self.table_model.extra:
+                all_cols.append('file_missing')
         else:
             # only standard columns for better overview
             all_cols = ['stem', 'duration', 'channels',
                         'tonality', 'tempo', 'bit_depth']
 
-        self.table_model.columns = all_cols
-        self.table_model.layoutChanged.emit()
+        self.table_model.set_columns(all_cols)
         self.last_sorted_column = -1
 
     def update_plot(self):
         """
         Update scatter plot based on axis selection and filtered data.
+        Only the parts that changed since the last call are redrawn.
         """
-        df = self.table_model.df
+        layer = self.scatter_layer
+        columns = self.data_model.all_columns
         x_col = self.x_combo.currentText()
         y_col = self.y_combo.currentText()
 
         # Clear previous data
-        if x_col not in df.columns or y_col not in df.columns or df.empty:
-            self.scatter.setData([])
+        if (x_col not in columns or y_col not in columns or
+                len(self.data_model.rows) == 0):
+            layer.clear()
             return
 
-        x = df[x_col].values
-        y = df[y_col].values
-
         # --- Color Coding ---
         use_distance_color = (
             self.show_color_checkbox.isChecked() and
-            'distance' in df.columns and df['distance'].notnull().any()
+            layer.has_values('distance')
         )
 
         use_feature_color = (
             self.color_feature_checkbox.isChecked() and
-            self.color_combo.currentText() in df.columns and
-            df[self.color_combo.currentText()].notnull().any()
+            self.color_combo.currentText() in columns and
+            layer.has_values(self.color_combo.currentText())
         )
 
         # ensure only one color gradient is active
@@ -433,57 +642,13 @@ class MainWindow(QWidget):
             use_feature_color = False
 
         if use_distance_color:
-            distances = df['distance'].values
-            min_dist = np.nanmin(distances)
-            max_dist = np.nanmax(distances)
-            norm = (distances - min_dist) / (max_dist - min_dist + 1e-9)
-            colors = []
-            for val in norm:
-                val = val ** 0.6  # smoother gradient for visibility
-                # Blue (0,0,255) → Red (255,0,0)
-                r = int(val * 255)
-                g = 0
-                b = int((1 - val) * 255)
-                colors.append(pg.mkBrush(r, g, b, 200))
+            color = ('distance', None)
         elif use_feature_color:
-            feat_col = self.color_combo.currentText()
-            values = df[feat_col].values
-            # check for NaN values
-            valid = ~np.isnan(values)
-            if np.any(valid):
-                min_val = np.nanmin(values)
-                max_val = np.nanmax(values)
-                norm = np.full_like(values, 0.5)  # Default mid-gray
-                norm[valid] = (
-                    (values[valid] - min_val) / (max_val - min_val + 1e-9)
-                )
-                norm = np.clip(norm, 0, 1)
-            else:
-                norm = np.zeros_like(values)
-            colors = []
-            for val, valid_val in zip(norm, valid):
-                if not valid_val:
-                    colors.append(pg.mkBrush(255, 255, 255, 200))
-                else:
-                    val = val ** 0.6
-                    r = int(val * 255)
-                    g = int(val * 165)
-                    b = int((1 - val) * 255)
-                    colors.append(pg.mkBrush(r, g, b, 200))
+            color = ('feature', self.color_combo.currentText())
         else:
-            colors = [pg.mkBrush(0, 0, 255, 120)] * len(df)
+            color = None
 
-        # Store index mapping for click lookup
-        spots = []
-        for idx, (px, py, col) in enumerate(zip(x, y, colors)):
-            original_idx = df.index[idx]
-            spots.append({
-                'pos': (px, py),
-                'data': original_idx,  # row index in df_filtered
-                'brush': col
-            })
-
-        self.scatter.setData(spots)
+        layer.update(x_col, y_col, color)
 
         # Clear highlight
         self.highlight.setData([])
@@ -492,42 +657,45 @@ class MainWindow(QWidget):
         """
         Shows the sorted output list with only 'stem' and 'distance'.
         """
-        df = self.table_model.df.copy()
-
-        # only cols 'stem' & 'distance'
-        if 'distance' not in df.columns:
-            df['distance'] = np.nan  # Initialize
+        self.sorted_table_model.update_view(
+            self.table_model.rows, self.data_model.derived_columns()
+        )
 
-        df = df[['stem', 'distance']]
-        self.sorted_table_model.update_data(df)
+    def plot_range_changed(self, view_box, view_range, changed):
+        """
+        Switch between points and density image for the visible range.
+        """
+        self.scatter_layer.set_view_range(*view_range)
 
-    def scatter_point_clicked(self, plot, points, index):
+    def plot_clicked(self, event):
         """
-        Handle clicks on scatter plot points.
+        Handle clicks into the scatter plot, the nearest point within a
+        few pixels is selected.
         """
-        if not points:
+        if event.button() != Qt.LeftButton:
+            return
+        view_box = self.plot_widget.getViewBox()
+        if not view_box.sceneBoundingRect().contains(event.scenePos()):
             return
 
-        point = points[0]
-        original_idx = point.data()
+        pos = view_box.mapSceneToView(event.scenePos())
+        px, py = view_box.viewPixelSize()
+        original_idx = self.scatter_layer.point_at(
+            pos.x(), pos.y(), px * CLICK_RADIUS_PX, py * CLICK_RADIUS_PX
+        )
+        if original_idx is None:
+            return
 
-        # Find the row position in current df
-        try:
-            row_pos = self.table_model.df.index.get_loc(original_idx)
-        except KeyError:
+        # Find the row position in the current table
+        location = self.row_index.locate_index(original_idx)
+        if location.main_row is None:
             print("Index not in current table model!")
             return
 
-        self.select_sample_by_row(row_pos)
-
-        # Highlight selected point
-        self.highlight.setData([{'pos': point.pos()}])
-
-        # Update table selection
-        self.table_view.selectRow(row_pos)
+        self.select_sample_by_row(location.main_row)
 
-        # Select in sorted table
-        self.select_in_sorted_table(self.selected_file)
+        # Highlight point, update table selections
+        self.show_in_views(location)
 
     def table_row_clicked(self, index):
         """
@@ -535,80 +703,153 @@ class MainWindow(QWidget):
         """
         # Get the row in the sorted DataFrame
         view_row = index.row()
-        if view_row >= len(self.table_model.df):
+        if view_row >= self.table_model.rowCount():
             print("Row index out of bounds")
             return
 
         self.select_sample_by_row(view_row)
 
         # Get the original index
-        original_idx = self.table_model.df.index[view_row]
-
-        # Highlight the corresponding point in the scatter plot
-        for s in self.scatter.points():
-            if s.data() == original_idx:
-                self.highlight.setData([{'pos': s.pos()}])
-                break
+        original_idx = self.table_model.row_index(view_row)
 
-        self.select_in_sorted_table(self.selected_file)
+        # Highlight the corresponding point and sorted table row
+        self.show_in_views(self.row_index.locate_index(original_idx))
 
     def sorted_table_row_clicked(self, index):
         """
         Handle click on sorted output list
         """
         view_row = index.row()
-        if view_row >= len(self.sorted_table_model.df):
+        if view_row >= self.sorted_table_model.rowCount():
             return
 
-        stem = self.sorted_table_model.df.iloc[view_row]['stem']
-
         # Find original index
-        df = self.table_model.df
-        matches = df[df['stem'] == stem]
-        if matches.empty:
+        original_idx = self.sorted_table_model.row_index(view_row)
+        location = self.row_index.locate_index(original_idx)
+        if location.main_row is None:
             print("Kein passender Eintrag in Haupttabelle!")
             return
 
-        original_idx = matches.index[0]
-        row_pos = df.index.get_loc(original_idx)
+        self.select_sample_by_row(location.main_row)
 
-        self.select_sample_by_row(row_pos)
+        # Select row in table view, highlight scatter point
+        self.show_in_views(location)
 
-        # Select row in table view
-        self.table_view.selectRow(row_pos)
+    def show_in_views(self, location):
+        """
+        Select a sample (a Location from row_index) in both tables and
+        mark it in the scatter plot.
+        """
+        if location.main_row is not None:
+            self.select_table_row(self.table_view, location.main_row)
+        if location.sorted_row is not None:
+            self.select_table_row(
+                self.sorted_table_view, location.sorted_row
+            )
+        self.highlight_point(location.original_idx)
 
-        # Highlight scatter point
-        for s in self.scatter.points():
-            if s.data() == original_idx:
-                self.highlight.setData([{'pos': s.pos()}])
-                break
+    def highlight_point(self, original_idx):
+        """
+        Mark the plot point of a row position in df_all.
+        """
+        pos = self.scatter_layer.point_pos(original_idx)
+        if pos is None:
+            self.highlight.setData([])
+        else:
+            self.highlight.setData(pos=[pos])
 
     def select_sample_by_row(self, row_pos):
         """
         Store selected sample info by row position.
         """
         # Always positional!
-        row = self.table_model.df.iloc[row_pos]
-
-        self.selected_file = row['stem']
-        dir_path = ast.literal_eval(row['dir'])
-        self.sample_path = os.path.join(
-            os.getcwd(), 'Samples', *dir_path, f"{self.selected_file}.wav"
+        stem = self.table_model.value(row_pos, 'stem')
+        if stem != self.selected_file:
+            # a running search is for the previous reference
+            self.cancel_similarity()
+        self.selected_file = stem
+        original_idx = self.table_model.row_index(row_pos)
+        self.sample_path = self.data_model.sample_path(original_idx)
+        self.sample_missing = bool(
+            self.data_model.file_missing[original_idx]
         )
 
         print(f"Selected: {self.selected_file}")
         print(f"Row pos: {row_pos}")
+        self.show_waveform()
+        self.prefetch_audio(original_idx)
+
+    def show_waveform(self):
+        """
+        Show the waveform of the selected sample, its peaks are built in
+        the background if needed.
+        """
+        if self.sample_missing or not self.sample_path:
+            self.waveform.set_peaks(None)
+            return
+        peaks = self.peak_cache.load(self.sample_path)
+        self.waveform.set_peaks(peaks)
+        if peaks is None:
+            self.peak_builder.request([self.sample_path])
+        else:
+            self.update_waveform_region()
+
+    def on_peaks_ready(self, path):
+        if path == self.sample_path and self.waveform.peaks is None:
+            self.show_waveform()
+
+    def update_waveform_region(self):
+        self.waveform.set_region(
+            self.start_spin.value(), self.end_spin.value()
+        )
 
-    def select_in_sorted_table(self, stem):
+    def set_play_region(self, start, end):
         """
-        Wählt in der Output-Liste den passenden Eintrag.
+        Take the region dragged in the waveform as start/end of the
+        player.
         """
-        matches = self.sorted_table_model.df[
-            self.sorted_table_model.df['stem'] == stem
+        for spin, value in ((self.start_spin, start), (self.end_spin, end)):
+            spin.blockSignals(True)
+            spin.setValue(value)
+            spin.blockSignals(False)
+
+    def prefetch_audio(self, original_idx):
+        """
+        Decode the samples likely played next into the audio cache: the
+        selected one, its neighbours in both tables and the top of the
+        similarity list.
+        """
+        location = self.row_index.locate_index(original_idx)
+        views = [
+            (self.table_model, location.main_row),
+            (self.sorted_table_model, location.sorted_row),
         ]
-        if not matches.empty:
-            row = matches.index[0]
-            self.sorted_table_view.selectRow(row)
+        rows = [original_idx]
+        for offset in range(1, PREFETCH_NEIGHBOURS + 1):
+            for model, row in views:
+                if row is None:
+                    continue
+                for neighbour in (row + offset, row - offset):
+                    if 0 <= neighbour < model.total_rows():
+                        rows.append(model.row_index(neighbour))
+        rows.extend(self.sorted_table_model.rows[:PREFETCH_TOP].tolist())
+
+        missing = self.data_model.file_missing
+        paths = [
+            self.data_model.sample_path(row)
+            for row in dict.fromkeys(int(row) for row in rows)
+            if not missing[row]
+        ]
+        paths = [path for path in paths if path]
+        self.audio_player.prefetch(paths)
+        self.peak_builder.request(paths)
+
+    def select_table_row(self, view, row):
+        """
+        Select a view row, fetching it into the table first if needed.
+        """
+        view.model().fetch_to(row)
+        view.selectRow(row)
 
     def handle_header_clicked(self, section):
         if section == self.last_sorted_column:
@@ -650,25 +891,48 @@ class MainWindow(QWidget):
             print("No feature selected!")
             return
 
-        method = self.similarity_combo.currentText()
-
-        if method == "Euclidean":
-            df_sorted = self.data_model.compute_distances(
-                self.selected_file, selected_features
-            )
+        if self.similarity_combo.currentText() == "Cosine":
+            metric = 'cosine'
         else:
-            df_sorted = self.data_model.compute_cosine_distances(
-                self.selected_file, selected_features
-            )
+            metric = 'euclidean'
+
+        # runs on a worker thread, see on_similarity_finished
+        self.similarity_query.submit(
+            self.selected_file, selected_features, metric,
+            self.data_model.rows
+        )
+        self.similarity_progress.setValue(0)
+        self.similarity_progress.show()
+
+    def on_similarity_progress(self, done, total):
+        self.similarity_progress.setMaximum(max(total, 1))
+        self.similarity_progress.setValue(done)
+
+    def on_similarity_finished(self, result):
+        """
+        Publish a similarity result to both tables and the plot at once.
+        """
+        self.similarity_progress.hide()
+        if result is None:
+            return
+        rows = self.data_model.set_distances(*result)
 
         # Update MainTable & Plot
-        self.table_model.update_data(df_sorted)
-        self.data_model.df_filtered = df_sorted
+        extra = self.data_model.derived_columns()
+        self.table_model.update_view(rows, extra)
         self.update_plot()
 
         # Update Output list ['stem', 'distance']
-        df_out = df_sorted[['stem', 'distance']].copy()
-        self.sorted_table_model.update_data(df_out)
+        self.sorted_table_model.update_view(rows, extra)
+
+        # the best matches are likely played next
+        location = self.row_index.locate(self.selected_file)
+        if location.original_idx is not None:
+            self.prefetch_audio(location.original_idx)
+
+    def cancel_similarity(self):
+        self.similarity_query.cancel()
+        self.similarity_progress.hide()
 
     def toggle_all_features(self, state):
         """
@@ -685,8 +949,14 @@ class MainWindow(QWidget):
         if not self.selected_file:
             print("No file selected!")
             return
+        if self.sample_missing or not self.sample_path:
+            print(f"File not found: {self.sample_path}")
+            return
 
-        self.audio_player.load_audio(self.sample_path)
+        end = self.end_spin.value()
+        self.audio_player.load_audio(
+            self.sample_path, self.start_spin.value(), end or None
+        )
         self.audio_player.play()
 
     def toggle_loop(self, state):
@@ -695,6 +965,15 @@ class MainWindow(QWidget):
         """
         self.audio_player.set_loop(bool(state))
 
+    def closeEvent(self, event):
+        """
+        Wait for a running data loader, a QThread must not be destroyed
+        with the window while it still runs.
+        """
+        if self.loader.isRunning():
+            self.loader.wait()
+        super().closeEvent(event)
+
     def toggle_distance_checkbox(self, state):
         if state:
             self.color_feature_checkbox.setChecked(False)